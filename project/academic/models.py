@@ -28,6 +28,7 @@ class AcademicQuestion(Document):
     status = StringField(required=True, choices=[
         'pending', 'assigned', 'in_progress', 'answered', 'closed'
     ], default='pending')
+    suggested_teachers = ListField(ReferenceField('users.MongoUser'))  # Best matching teachers when created, best first
     price_quote = StringField()  # Price quoted by teacher
     payment_status = StringField(choices=['unpaid', 'paid'], default='unpaid')
     created_at = DateTimeField(required=True)
@@ -40,7 +41,8 @@ class AcademicQuestion(Document):
             'student', 
             'teacher', 
             'status', 
-            'created_at'
+            'created_at',
+            ('suggested_teachers', 'status')
         ]
     }
 
@@ -23,11 +23,10 @@ class AcademicQuestionCreateSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from academic.models import AcademicQuestion
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         import datetime
         
-        user_id = self.context['request'].user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         media_data = validated_data.pop('media', [])
         now = datetime.datetime.now()
@@ -45,6 +44,10 @@ class AcademicQuestionCreateSerializer(serializers.Serializer):
             media=[]
         )
         
+        # Route the new item to the teachers best suited to its subject
+        from users.matching import match_experts
+        academic_question.suggested_teachers = match_experts('teacher', validated_data['subject'])
+        
         # Add media if provided
         for media_item in media_data:
             from academic.models import AcademicMedia
@@ -82,6 +85,12 @@ class AcademicQuestionUpdateSerializer(serializers.Serializer):
     price_quote = serializers.CharField(required=False)
     payment_status = serializers.ChoiceField(choices=['unpaid', 'paid'], required=False)
     
+    def validate_price_quote(self, value):
+        # Quotes become earning amounts once paid, so they must be plain numbers
+        from users.earnings import parse_amount
+        parse_amount(value)
+        return value
+    
     def update(self, instance, validated_data):
         for attr, value in validated_data.items():
             if attr == 'teacher_id':
@@ -123,27 +132,21 @@ class AcademicQuestionUpdateSerializer(serializers.Serializer):
             )
             instance.messages.append(message)
             
-            # Update teacher's completed services count
-            if instance.teacher:
-                from users.models import ExpertProfile
-                expert_profile = ExpertProfile.objects(user=instance.teacher).first()
-                if expert_profile:
-                    completed = int(expert_profile.completed_services)
-                    expert_profile.completed_services = str(completed + 1)
-                    expert_profile.save()
-            
-            # Create earning record if payment_status is paid
+            # Create earning record if payment_status is paid; first, as an invalid quote stops the update
             if instance.payment_status == 'paid' and instance.teacher and instance.price_quote:
-                from users.models import EarningRecord
-                earning = EarningRecord(
+                from users.earnings import create_earning
+                create_earning(
                     expert=instance.teacher,
                     amount=instance.price_quote,
                     service_type='academic',
                     service_id=str(instance.id),
-                    date=datetime.datetime.now(),
                     is_paid=True
                 )
-                earning.save()
+            
+            # Update teacher's completed services count
+            if instance.teacher:
+                from users.experts import record_completed_service
+                record_completed_service(instance.teacher)
         
         instance.updated_at = datetime.datetime.now()
         instance.save()
@@ -183,10 +186,9 @@ class AcademicMessageCreateSerializer(serializers.Serializer):
     
     def create(self, validated_data, question_id):
         from academic.models import AcademicQuestion, AcademicMessage
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        user = self.context['request'].user
-        mongo_user = MongoUser.objects(user_id=str(user.id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         question = AcademicQuestion.objects(id=question_id).first()
         if not question:
@@ -222,10 +224,9 @@ class AcademicAnswerSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from academic.models import AcademicAnswer, AcademicQuestion, AcademicMedia
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        user = self.context['request'].user
-        mongo_user = MongoUser.objects(user_id=str(user.id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         question_id = validated_data.pop('question_id')
         question = AcademicQuestion.objects(id=question_id).first()
@@ -12,7 +12,8 @@ from .serializers import (
     AcademicMessageCreateSerializer,
     AcademicAnswerSerializer
 )
-from users.models import MongoUser
+from users.cache import get_mongo_user
+from users.directory import directory_page
 
 class AcademicQuestionViewSet(viewsets.ViewSet):
     def get_permissions(self):
@@ -21,8 +22,7 @@ class AcademicQuestionViewSet(viewsets.ViewSet):
         return [permissions.IsAuthenticated()]
     
     def list(self, request):
-        user_id = request.user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(request)
         
         # Filter questions based on user role
         if request.user.user_type == 'student':
@@ -31,6 +31,9 @@ class AcademicQuestionViewSet(viewsets.ViewSet):
             # Teachers see both assigned questions and unassigned questions they can take
             assigned_questions = AcademicQuestion.objects(teacher=mongo_user)
             unassigned_questions = AcademicQuestion.objects(teacher=None, status='pending')
+            # ?matched=true: only the pending questions this teacher was suggested for
+            if request.query_params.get('matched') in ('1', 'true'):
+                unassigned_questions = unassigned_questions.filter(suggested_teachers=mongo_user.id)
             academic_questions = list(assigned_questions) + list(unassigned_questions)
         else:
             return Response({"detail": "Unauthorized user type"}, status=status.HTTP_403_FORBIDDEN)
@@ -60,8 +63,7 @@ class AcademicQuestionViewSet(viewsets.ViewSet):
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user is authorized to view this question
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             is_student_owner = str(academic_question.student.id) == str(mongo_user.id)
             is_assigned_teacher = academic_question.teacher and str(academic_question.teacher.id) == str(mongo_user.id)
@@ -82,8 +84,7 @@ class AcademicQuestionViewSet(viewsets.ViewSet):
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user is authorized to update this question
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             is_student_owner = str(academic_question.student.id) == str(mongo_user.id)
             is_assigned_teacher = academic_question.teacher and str(academic_question.teacher.id) == str(mongo_user.id)
@@ -121,24 +122,12 @@ class AcademicQuestionViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def list_teachers(self, request):
-        # Get all teachers for student to view
-        teachers = MongoUser.objects(user_type='teacher')
-        
-        teacher_list = []
-        for teacher in teachers:
-            from users.models import ExpertProfile
-            profile = ExpertProfile.objects(user=teacher).first()
-            teacher_list.append({
-                'id': str(teacher.id),
-                'name': f"{teacher.first_name} {teacher.last_name}",
-                'expertise_areas': profile.expertise_areas if profile else "",
-                'experience_years': profile.experience_years if profile else "0",
-                'hourly_rate': profile.hourly_rate if profile else "0",
-                'rating': profile.rating if profile else "0.0",
-                'completed_services': profile.completed_services if profile else "0"
-            })
-        
-        return Response(teacher_list)
+        # Page of teachers for students to browse, cached; ?page=&page_size=&area=&ordering=-rating
+        # &max_hourly_rate=&min_rating=&min_experience_years=
+        try:
+            return Response(directory_page(request, 'teacher'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class AcademicAnswerViewSet(viewsets.ViewSet):
@@ -159,8 +148,7 @@ class AcademicAnswerViewSet(viewsets.ViewSet):
                 return Response({"detail": "Academic question not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check authorization
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             is_student_owner = str(academic_question.student.id) == str(mongo_user.id)
             is_assigned_teacher = academic_question.teacher and str(academic_question.teacher.id) == str(mongo_user.id)
@@ -0,0 +1,152 @@
+"""
+Cold storage for the message history of inactive chat rooms.
+
+Archiving a room writes all of its message buckets, BSON-encoded and zlib
+compressed, into one segment (a file under CHAT_ARCHIVE_DIR, or a GridFS
+file), then deletes the buckets and leaves only ``archive_ref`` on the room.
+The room document itself, with its inbox summary, stays in chat_rooms.
+Opening an archived room restores its buckets from the segment.
+
+Segment references are prefixed with the backend that wrote them, so
+segments stay readable after CHAT_ARCHIVE_BACKEND is changed.
+"""
+
+import datetime
+import os
+import tempfile
+import zlib
+
+import bson
+from bson import ObjectId
+from django.conf import settings
+
+from chat.models import ChatRoom, ChatMessageBucket
+
+
+class LocalSegmentStore:
+    name = 'local'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, room_id, data):
+        os.makedirs(self.directory, exist_ok=True)
+        key = f'{room_id}-{ObjectId()}.bson.z'
+        # Write under a temporary name so a crash never leaves a truncated segment behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.directory, key))
+        return key
+
+    def read(self, key):
+        with open(os.path.join(self.directory, key), 'rb') as f:
+            return f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.directory, key))
+        except FileNotFoundError:
+            pass
+
+
+class GridFSSegmentStore:
+    name = 'gridfs'
+
+    def __init__(self, collection='chat_archive'):
+        import gridfs
+        from mongoengine.connection import get_db
+
+        self.fs = gridfs.GridFS(get_db(), collection=collection)
+
+    def write(self, room_id, data):
+        return str(self.fs.put(data, filename=str(room_id)))
+
+    def read(self, key):
+        return self.fs.get(ObjectId(key)).read()
+
+    def delete(self, key):
+        self.fs.delete(ObjectId(key))
+
+
+def get_segment_store(name=None):
+    name = name or getattr(settings, 'CHAT_ARCHIVE_BACKEND', 'local')
+    if name == 'local':
+        return LocalSegmentStore(getattr(settings, 'CHAT_ARCHIVE_DIR', 'chat_archive'))
+    if name == 'gridfs':
+        return GridFSSegmentStore()
+    raise ValueError(f"Unknown chat archive backend: {name}")
+
+
+def _open_segment(ref):
+    """Return (store, key) for a segment reference"""
+    name, key = ref.split(':', 1)
+    return get_segment_store(name), key
+
+
+def archive_room(room_id, dry_run=False):
+    """
+    Move the message buckets of a room into a segment.
+
+    Returns (bytes of bucket documents removed, bytes of the compressed
+    segment), or None if the room has nothing to archive or received a
+    message while being archived.
+    """
+    room = ChatRoom.objects(id=room_id, archive_ref=None).only('updated_at').first()
+    if room is None:
+        return None
+    buckets = list(ChatMessageBucket._get_collection().find({'room': ObjectId(room_id)}).sort('first_id', 1))
+    if not buckets:
+        return None
+
+    encoded = [bson.encode(bucket) for bucket in buckets]
+    data = zlib.compress(b''.join(encoded), 9)
+    reclaimed = sum(len(doc) for doc in encoded)
+    if dry_run:
+        return reclaimed, len(data)
+
+    store = get_segment_store()
+    ref = f'{store.name}:{store.write(room_id, data)}'
+
+    # Only stub the room if no message arrived since it was read
+    if not ChatRoom.objects(id=room_id, archive_ref=None, updated_at=room.updated_at).update_one(
+        set__archive_ref=ref,
+        set__archived_at=datetime.datetime.now()
+    ):
+        store.delete(ref.split(':', 1)[1])
+        return None
+
+    # A bucket that took a message meanwhile changed its count; it stays hot and wins over its archived copy
+    for bucket in buckets:
+        ChatMessageBucket._get_collection().delete_one({'_id': bucket['_id'], 'count': bucket['count']})
+    return reclaimed, len(data)
+
+
+def rehydrate_room(room_id, ref):
+    """Restore the buckets of an archived room from its segment and drop the stub"""
+    store, key = _open_segment(ref)
+    try:
+        data = store.read(key)
+    except Exception:  # Missing file or GridFS NoFile
+        # Another request restored the room and removed the segment first
+        if ChatRoom.objects(id=room_id, archive_ref=ref).count():
+            raise
+        return
+
+    collection = ChatMessageBucket._get_collection()
+    for bucket in bson.decode_all(zlib.decompress(data)):
+        bucket_id = bucket.pop('_id')
+        bucket.pop('is_open', None)  # Restored closed; the room may have opened a new bucket meanwhile
+        collection.update_one({'_id': bucket_id}, {'$setOnInsert': bucket}, upsert=True)
+
+    if ChatRoom.objects(id=room_id, archive_ref=ref).update_one(unset__archive_ref=True, unset__archived_at=True):
+        store.delete(key)
+
+
+def ensure_hot(room):
+    """Rehydrate ``room`` if it is archived; the room must have been loaded with archive_ref"""
+    if room.archive_ref:
+        rehydrate_room(room.id, room.archive_ref)
+        room.archive_ref = None
+        room.archived_at = None
+    return room
@@ -0,0 +1,194 @@
+"""
+Write-behind buffer for chat messages.
+
+With CHAT_WRITE_BEHIND enabled, ChatConsumer fans a message out as soon as it
+has an id and a sequence number and hands it to this buffer. Sequence
+numbers come from a SequenceAllocator, which reserves the numbers of all the
+messages of a room waiting at once with a single $inc. The buffer persists
+pending messages, and the room summaries they change, with one bulk_write on
+each collection every CHAT_WRITE_BEHIND_FLUSH_INTERVAL seconds, or as soon as
+CHAT_WRITE_BEHIND_BATCH_SIZE messages are waiting. A failed flush is retried
+from the step that failed: messages already stored only have their rooms
+updated again, and a partly stored batch skips what it stored. At most
+CHAT_WRITE_BEHIND_MAX_PENDING messages are held in memory; past that, add()
+waits for a flush to finish, which slows senders down instead of growing the
+buffer.
+"""
+
+import asyncio
+import atexit
+import logging
+import time
+import weakref
+
+from django.conf import settings
+
+from chat import metrics
+from chat.persistence import persistence_sync_to_async
+from chat.store import bulk_append, bulk_record, reserve_seqs
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failed flushes after which a batch is dropped instead of retried
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def store_messages(batch, skip_stored=False):
+    """Store the messages of a batch of (room_id, message, recipient_id) triples"""
+    bulk_append([(room_id, message) for room_id, message, _ in batch], skip_stored=skip_stored)
+
+
+class SequenceAllocator:
+    """Hands out per-room sequence numbers, reserving those asked for while a reservation is running together"""
+
+    def __init__(self):
+        self._waiting = {}  # room_id -> futures waiting for a number, in arrival order
+        self._reserving = set()
+
+    async def next(self, room_id):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(room_id, []).append(future)
+        if room_id not in self._reserving:
+            self._reserving.add(room_id)
+            asyncio.ensure_future(self._reserve(room_id))
+        return await future
+
+    async def _reserve(self, room_id):
+        try:
+            while self._waiting.get(room_id):
+                waiting = self._waiting.pop(room_id)
+                try:
+                    last = await persistence_sync_to_async(reserve_seqs)(room_id, len(waiting))
+                except Exception as exc:
+                    for future in waiting:
+                        future.set_exception(exc)
+                    continue
+                metrics.observe('chat.sequence.batch_size', len(waiting))
+                for seq, future in enumerate(waiting, start=last - len(waiting) + 1):
+                    future.set_result(seq)
+        finally:
+            self._reserving.discard(room_id)
+
+
+class MessageBuffer:
+    def __init__(self, flush_interval, batch_size, max_pending):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = []
+        self._unrecorded = []  # Stored messages whose rooms are still to be updated
+        self._in_flight = 0
+        self._failed_attempts = 0
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def depth(self):
+        """Messages accepted but not yet persisted"""
+        return len(self._pending) + len(self._unrecorded) + self._in_flight
+
+    async def add(self, room_id, message, recipient_id):
+        async with self._space:
+            await self._space.wait_for(lambda: self.depth < self.max_pending)
+            self._pending.append((room_id, message, recipient_id))
+
+        metrics.set_gauge('chat.buffer.depth', self.depth)
+        self._has_pending.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await self._has_pending.wait()
+            try:
+                # The first pending message starts the clock; a full batch cuts it short
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Persist everything pending now; flushes never overlap, so per-room order is kept"""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            unrecorded, self._unrecorded = self._unrecorded, []
+            self._has_pending.clear()
+            self._batch_full.clear()
+            if not batch and not unrecorded:
+                return
+
+            size = self._in_flight = len(batch) + len(unrecorded)
+            start = time.perf_counter()
+            try:
+                if batch:
+                    # After a failure, part of the batch may be stored already
+                    await persistence_sync_to_async(store_messages)(batch, skip_stored=self._failed_attempts > 0)
+                    unrecorded, batch = unrecorded + batch, []
+                await persistence_sync_to_async(bulk_record)(unrecorded)
+                self._failed_attempts = 0
+                metrics.incr('chat.buffer.flushed_messages', size)
+                metrics.incr('chat.buffer.flushes')
+            except Exception:
+                self._failed_attempts += 1
+                metrics.incr('chat.buffer.flush_errors')
+                if self._failed_attempts < MAX_FLUSH_ATTEMPTS:
+                    logger.exception('Chat buffer flush of %d messages failed, retrying', size)
+                    self._pending[:0] = batch
+                    self._unrecorded[:0] = unrecorded
+                    self._has_pending.set()
+                else:
+                    logger.exception('Chat buffer flush of %d messages failed, dropping them', size)
+                    metrics.incr('chat.buffer.dropped_messages', size)
+                    self._failed_attempts = 0
+            finally:
+                self._in_flight = 0
+                metrics.observe('chat.buffer.flush_latency', time.perf_counter() - start)
+                metrics.set_gauge('chat.buffer.depth', self.depth)
+
+        async with self._space:
+            self._space.notify_all()
+
+    def flush_sync(self):
+        """Persist what is still pending from outside the event loop, e.g. at interpreter shutdown"""
+        batch, self._pending = self._pending, []
+        unrecorded, self._unrecorded = self._unrecorded, []
+        if batch:
+            store_messages(batch, skip_stored=self._failed_attempts > 0)
+        if unrecorded or batch:
+            bulk_record(unrecorded + batch)
+
+
+# asyncio primitives belong to one event loop, so there is one buffer and allocator per loop
+_buffers = weakref.WeakKeyDictionary()
+_sequencers = weakref.WeakKeyDictionary()
+
+
+def get_buffer():
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = MessageBuffer(
+            flush_interval=getattr(settings, 'CHAT_WRITE_BEHIND_FLUSH_INTERVAL', 0.01),
+            batch_size=getattr(settings, 'CHAT_WRITE_BEHIND_BATCH_SIZE', 200),
+            max_pending=getattr(settings, 'CHAT_WRITE_BEHIND_MAX_PENDING', 10000)
+        )
+        _buffers[loop] = buffer
+        atexit.register(buffer.flush_sync)
+    return buffer
+
+
+def get_sequencer():
+    loop = asyncio.get_running_loop()
+    sequencer = _sequencers.get(loop)
+    if sequencer is None:
+        sequencer = _sequencers[loop] = SequenceAllocator()
+    return sequencer
+
+
+def write_behind_enabled():
+    return getattr(settings, 'CHAT_WRITE_BEHIND', False)
@@ -0,0 +1,58 @@
+"""
+JSON codec for chat WebSocket frames.
+
+CHAT_JSON_CODEC selects the implementation: 'json' (stdlib), 'orjson', or
+'auto' (the default), which uses orjson when it is installed and falls back
+to the stdlib otherwise.
+"""
+
+import json
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+
+def _json_dumps(obj):
+    return json.dumps(obj)
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj).decode()
+
+
+CODECS = {
+    'json': (_json_dumps, json.loads),
+}
+if orjson is not None:
+    CODECS['orjson'] = (_orjson_dumps, orjson.loads)
+
+
+def get_codec(name=None):
+    """Return the (dumps, loads) pair for a codec name; dumps always returns str"""
+    name = name or getattr(settings, 'CHAT_JSON_CODEC', 'auto')
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name not in CODECS:
+        raise ValueError(f"Unknown or unavailable chat JSON codec: {name}")
+    return CODECS[name]
+
+
+_active = None
+
+
+def dumps(obj):
+    global _active
+    if _active is None:
+        _active = get_codec()
+    return _active[0](obj)
+
+
+def loads(text):
+    global _active
+    if _active is None:
+        _active = get_codec()
+    return _active[1](text)
@@ -1,23 +1,77 @@
-import json
 import datetime
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
+from mongoengine.errors import ValidationError
 from mongoengine.queryset.visitor import Q
 
+from chat import codec, metrics
+from chat.buffer import get_buffer, get_sequencer, write_behind_enabled
+from chat.persistence import persistence_sync_to_async
+from chat.presence import get_presence, watch_group
+from chat.ratelimit import get_limiter
+from chat.typing_indicators import get_coalescer
+
+# Frames that cost a database round trip or a room fan-out, and so draw on the rate limiter;
+# typing frames draw on it only when they are fanned out
+RATE_LIMITED_TYPES = ('message', 'resume')
+
+# Close code for sockets that cannot keep up with their room
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
         
+        # Resolve the sender once; it is trusted for the life of the socket
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        
+        sender = await self.resolve_sender(self.room_id, user.id)
+        if sender is None:
+            await self.close()
+            return
+        self.sender_id, self.sender_name, self.recipient_id = sender
+        self.limiter = get_limiter(self.sender_id)
+        self.too_slow = False
+        self.last_heartbeat = time.monotonic()  # Connecting counts as the first heartbeat
+        
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
         
-        await self.accept()
+        # Echo the auth subprotocol if the token came in Sec-WebSocket-Protocol, or browsers drop the socket
+        await self.accept(subprotocol=self.scope.get('auth_subprotocol'))
+        
+        # Follow the other participant's presence before reading it, so no change falls in between
+        await self.channel_layer.group_add(watch_group(self.recipient_id), self.channel_name)
+        
+        # Mark the sender online and tell them whether the other participant is
+        presence = get_presence()
+        await presence.connect(self.channel_layer, self.sender_id, self.channel_name, self.room_group_name)
+        recipient_online = self.recipient_id in await presence.online([self.recipient_id])
+        await self.send(text_data=codec.dumps({
+            'type': 'presence',
+            'user_id': self.recipient_id,
+            'online': recipient_online
+        }))
     
     async def disconnect(self, close_code):
+        # A closed socket stops typing; tell the room instead of waiting for expiry
+        if hasattr(self, 'sender_id'):
+            await get_coalescer().stop(self.channel_layer, self.room_group_name, self.sender_id)
+            await get_presence().disconnect(self.channel_layer, self.sender_id, self.channel_name, self.room_group_name)
+            await self.channel_layer.group_discard(watch_group(self.recipient_id), self.channel_name)
+        
+        # Don't leave this socket's messages sitting in the write-behind buffer
+        if write_behind_enabled():
+            await get_buffer().flush()
+        
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -26,103 +80,224 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     # Receive message from WebSocket
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+        text_data_json = codec.loads(text_data)
         message_type = text_data_json.get('type', 'message')
         
+        if message_type in RATE_LIMITED_TYPES and not await self.allow_frame():
+            return
+        
         if message_type == 'message':
-            sender_id = text_data_json['sender_id']
             content = text_data_json['content']
             file_url = text_data_json.get('file_url', '')
             file_type = text_data_json.get('file_type', '')
             
-            # Save message to database
-            timestamp = await self.save_message(
-                self.room_id, 
-                sender_id, 
-                content, 
-                file_url, 
-                file_type
-            )
+            if write_behind_enabled():
+                # Assign id and sequence number now, persist with the next buffer flush
+                message = self.build_message(content, file_url, file_type)
+                message.seq = await get_sequencer().next(self.room_id)
+                await get_buffer().add(self.room_id, message, self.recipient_id)
+            else:
+                # Save message to database
+                message = await self.save_message(
+                    self.room_id, 
+                    content, 
+                    file_url, 
+                    file_type
+                )
             
-            # Send message to room group
+            # Send message to room group, encoded once here rather than once per recipient
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
-                    'sender_id': sender_id,
-                    'sender_name': text_data_json.get('sender_name', ''),
-                    'content': content,
-                    'file_url': file_url,
-                    'file_type': file_type,
-                    'timestamp': timestamp.isoformat()
+                    'text': codec.dumps(self.message_payload(message)),
+                    'sent_at': time.time()
                 }
             )
         
+        elif message_type == 'resume':
+            try:
+                after_seq = int(text_data_json['after_seq'])
+            except (KeyError, TypeError, ValueError):
+                return
+            await self.resume(after_seq)
+        
+        elif message_type == 'heartbeat':
+            # Keep this connection's presence alive; heartbeats much closer together than the TTL add nothing
+            now = time.monotonic()
+            if now - self.last_heartbeat >= getattr(settings, 'CHAT_PRESENCE_TTL', 60) / 4:
+                self.last_heartbeat = now
+                await get_presence().heartbeat(self.channel_layer, self.sender_id, self.channel_name, self.room_group_name)
+        
         elif message_type == 'typing':
-            # Send typing status to room group
-            await self.channel_layer.group_send(
+            # Send typing status to room group, coalesced per user and room
+            is_typing = bool(text_data_json['is_typing'])
+            coalescer = get_coalescer()
+            if coalescer.would_forward(self.room_group_name, self.sender_id, is_typing) and not await self.allow_frame():
+                return
+            await coalescer.update(
+                self.channel_layer,
                 self.room_group_name,
-                {
-                    'type': 'typing_status',
-                    'user_id': text_data_json['user_id'],
-                    'is_typing': text_data_json['is_typing']
-                }
+                self.sender_id,
+                is_typing
             )
     
+    async def allow_frame(self):
+        """Take a token for a frame, or tell the client it is throttled and return False"""
+        allowed, scope, retry_after = self.limiter.allow()
+        if not allowed:
+            metrics.incr(f'chat.ratelimit.throttled.{scope}')
+            await self.send(text_data=codec.dumps({
+                'type': 'error',
+                'code': 'rate_limited',
+                'scope': scope,
+                'retry_after': round(retry_after, 3)
+            }))
+        return allowed
+    
+    async def resume(self, after_seq):
+        """
+        Stream the messages sent after ``after_seq`` in chunks, then a
+        ``resumed`` frame with the room's current sequence number.
+        
+        The socket already joined the room group, so anything sent meanwhile
+        is queued behind this handler and delivered live afterwards; clients
+        drop frames whose seq they already have.
+        """
+        if write_behind_enabled():
+            await get_buffer().flush()
+        
+        target = await self.load_current_seq(self.room_id)
+        if target - after_seq > getattr(settings, 'CHAT_RESUME_MAX_MESSAGES', 1000):
+            # Too far behind for a delta; the client pages history over REST instead
+            await self.send(text_data=codec.dumps({'type': 'resync_required', 'seq': target}))
+            return
+        
+        cursor = after_seq
+        while cursor < target:
+            messages = [m for m in await self.load_messages_after_seq(self.room_id, cursor) if m.seq <= target]
+            if not messages:
+                break
+            cursor = messages[-1].seq
+            await self.send(text_data=codec.dumps({
+                'type': 'resume',
+                'messages': [self.message_payload(m) for m in messages]
+            }))
+        
+        await self.send(text_data=codec.dumps({'type': 'resumed', 'seq': target}))
+    
     # Receive message from room group
     async def chat_message(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'message',
-            'sender_id': event['sender_id'],
-            'sender_name': event['sender_name'],
-            'content': event['content'],
-            'file_url': event['file_url'],
-            'file_type': event['file_type'],
-            'timestamp': event['timestamp']
-        }))
+        await self.forward(event)
     
     # Receive typing status from room group
     async def typing_status(self, event):
-        # Send typing status to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'typing',
-            'user_id': event['user_id'],
-            'is_typing': event['is_typing']
-        }))
+        await self.forward(event)
     
-    @database_sync_to_async
-    def save_message(self, room_id, sender_id, content, file_url='', file_type=''):
-        from chat.models import ChatRoom, ChatMessage
-        from users.models import MongoUser
-        
-        # Get the chat room
-        chat_room = ChatRoom.objects(id=room_id).first()
-        if not chat_room:
-            raise ValueError(f"Chat room with ID {room_id} not found")
-        
-        # Get the sender
-        mongo_user = MongoUser.objects(id=sender_id).first()
-        if not mongo_user:
-            mongo_user = MongoUser.objects(user_id=sender_id).first()
+    # Receive presence change from room group
+    async def presence_update(self, event):
+        await self.forward(event)
+    
+    async def forward(self, event):
+        """
+        Forward a pre-encoded group event to the WebSocket, closing the socket
+        if events reach it too late.
         
-        if not mongo_user:
-            raise ValueError(f"User with ID {sender_id} not found")
+        Neither the channel layer nor the ASGI server exposes the per-socket
+        queue, so its length is judged by how long the event waited: a socket
+        that keeps falling behind only grows its backlog in the channel layer.
+        """
+        if self.too_slow:
+            return
         
-        # Create message
-        timestamp = datetime.datetime.now()
-        message = ChatMessage(
-            sender_id=str(mongo_user.id),
-            sender_name=f"{mongo_user.first_name} {mongo_user.last_name}",
+        lag = time.time() - event.get('sent_at', time.time())
+        metrics.observe('chat.fanout.lag', max(lag, 0.0))
+        if lag > getattr(settings, 'CHAT_SLOW_CONSUMER_MAX_LAG', 5):
+            self.too_slow = True
+            metrics.incr('chat.slow_consumer.closed')
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+            return
+        
+        await self.send(text_data=event['text'])
+    
+    @persistence_sync_to_async
+    def save_message(self, room_id, content, file_url='', file_type=''):
+        from chat.store import append_message, record_message
+        
+        message = self.build_message(content, file_url, file_type)
+        
+        # Update the room summary, then append to its open message bucket instead of rewriting the room
+        message.seq = record_message(room_id, message, self.recipient_id)
+        append_message(room_id, message)
+        
+        return message
+    
+    @persistence_sync_to_async
+    def load_current_seq(self, room_id):
+        from chat.store import current_seq
+        
+        return current_seq(room_id) or 0
+    
+    @persistence_sync_to_async
+    def load_messages_after_seq(self, room_id, after_seq):
+        from chat.store import get_messages_after_seq
+        
+        messages, _ = get_messages_after_seq(room_id, after_seq)
+        return messages
+    
+    @staticmethod
+    def message_payload(message):
+        return {
+            'type': 'message',
+            'message_id': message.message_id,
+            'seq': message.seq,
+            'sender_id': message.sender_id,
+            'sender_name': message.sender_name,
+            'content': message.content,
+            'file_url': message.file_url or '',
+            'file_type': message.file_type or '',
+            'timestamp': message.timestamp.isoformat()
+        }
+    
+    def build_message(self, content, file_url='', file_type=''):
+        from chat.models import ChatMessage
+        from chat.store import new_message_id
+        
+        return ChatMessage(
+            message_id=new_message_id(),
+            sender_id=self.sender_id,
+            sender_name=self.sender_name,
             content=content,
             file_url=file_url,
             file_type=file_type if file_url else None,
-            timestamp=timestamp
+            timestamp=datetime.datetime.now()
         )
+    
+    @persistence_sync_to_async
+    def resolve_sender(self, room_id, user_id):
+        """
+        Return (mongo user id, display name, other participant's id) if the user
+        is a participant of the room, else None
+        """
+        from chat.archive import ensure_hot
+        from chat.models import ChatRoom
+        from users.cache import get_mongo_user_by_id
+        
+        mongo_user = get_mongo_user_by_id(user_id)
+        if not mongo_user:
+            return None
+        
+        try:
+            room = ChatRoom.objects(
+                Q(id=room_id) & (Q(user1=mongo_user) | Q(user2=mongo_user))
+            ).only('user1', 'user2', 'archive_ref').no_dereference().first()
+        except ValidationError:  # Malformed room id
+            return None
+        if not room:
+            return None
         
-        # Add message to chat room
-        chat_room.messages.append(message)
-        chat_room.updated_at = timestamp
-        chat_room.save()
+        # An archived room becomes hot again when someone opens it
+        ensure_hot(room)
         
-        return timestamp
\ No newline at end of file
+        other = room.user2 if room.user1.id == mongo_user.id else room.user1
+        return str(mongo_user.id), f"{mongo_user.first_name} {mongo_user.last_name}", str(other.id)
\ No newline at end of file
@@ -0,0 +1,51 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_room
+from chat.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = 'Move the message history of chat rooms idle for longer than --days into cold storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Idle days before a room is archived (default: CHAT_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--limit', type=int, default=None, help='Archive at most this many rooms per run')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be archived without writing')
+        parser.add_argument('--every', type=float, default=None,
+                            help='Keep running, starting a new pass every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_pass(options)
+            if options['every'] is None:
+                break
+            time.sleep(options['every'])
+
+    def run_pass(self, options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 180)
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+        candidates = ChatRoom.objects(updated_at__lt=cutoff, archive_ref=None).order_by('updated_at').scalar('id')
+        if options['limit']:
+            candidates = candidates.limit(options['limit'])
+
+        archived = 0
+        reclaimed = 0
+        stored = 0
+        for room_id in list(candidates):
+            result = archive_room(room_id, dry_run=options['dry_run'])
+            if result is None:
+                continue
+            archived += 1
+            reclaimed += result[0]
+            stored += result[1]
+
+        action = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {archived} rooms idle since {cutoff:%Y-%m-%d}: '
+            f'{reclaimed} bytes of message buckets reclaimed, {stored} bytes in segments'
+        ))
@@ -0,0 +1,95 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from chat.models import ChatRoom, ChatMessageBucket
+from chat.store import room_key
+
+
+class Command(BaseCommand):
+    help = (
+        'Give every chat room its room_key, merging rooms that share a participant pair '
+        'and service into the oldest of them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without writing')
+
+    def handle(self, *args, **options):
+        rooms = ChatRoom._get_collection()
+        if rooms.find_one({'messages.0': {'$exists': True}}, {'_id': 1}):
+            raise CommandError('Some rooms still embed their messages; run migrate_chat_messages first')
+
+        if options['dry_run']:
+            keys = Counter(self.key_of(room) for room in rooms.find(
+                {'room_key': {'$exists': False}}, {'user1': 1, 'user2': 1, 'service_type': 1, 'service_id': 1}
+            ))
+            duplicates = sum(count - 1 for count in keys.values())
+            self.stdout.write(self.style.SUCCESS(
+                f'Would backfill {len(keys)} rooms and merge {duplicates} duplicates into them'
+            ))
+            return
+
+        backfilled = 0
+        merged = 0
+        while True:
+            # Oldest first, so the room that keeps a key is the one created first
+            room = rooms.find_one({'room_key': {'$exists': False}}, sort=[('created_at', 1), ('_id', 1)])
+            if room is None:
+                break
+            key = self.key_of(room)
+            try:
+                rooms.update_one({'_id': room['_id']}, {'$set': {'room_key': key}})
+                backfilled += 1
+            except DuplicateKeyError:
+                self.merge(room, rooms.find_one({'room_key': key}))
+                merged += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {backfilled} rooms, merged {merged} duplicates'))
+
+    def key_of(self, room):
+        return room_key(room['user1'], room['user2'], room.get('service_type'), room.get('service_id'))
+
+    def merge(self, duplicate, keeper):
+        """Move the messages and inbox state of ``duplicate`` into ``keeper`` and delete it"""
+        rooms = ChatRoom._get_collection()
+        buckets = ChatMessageBucket._get_collection()
+
+        last_message = duplicate.get('last_message')
+
+        # Renumber the moved messages after the keeper's own, so clients resuming the keeper receive them
+        for bucket in buckets.find({'room': duplicate['_id']}).sort('first_id', 1):
+            seq_room = rooms.find_one_and_update(
+                {'_id': keeper['_id']},
+                {'$inc': {'message_seq': len(bucket['messages'])}},
+                projection={'message_seq': 1},
+                return_document=ReturnDocument.AFTER
+            )
+            first_seq = seq_room['message_seq'] - len(bucket['messages']) + 1
+            for offset, message in enumerate(bucket['messages']):
+                message['seq'] = first_seq + offset
+                if last_message and message['message_id'] == last_message['message_id']:
+                    last_message['seq'] = message['seq']
+            buckets.update_one({'_id': bucket['_id']}, {'$set': {
+                'room': keeper['_id'],
+                'is_open': False,  # The keeper's own open bucket keeps taking its messages
+                'messages': bucket['messages'],
+                'first_seq': first_seq,
+                'last_seq': seq_room['message_seq'],
+            }})
+
+        update = {'$inc': {'message_count': duplicate.get('message_count', 0)}}
+        for user_id, unread in (duplicate.get('unread_counts') or {}).items():
+            update['$inc'][f'unread_counts.{user_id}'] = unread
+        update['$max'] = {f'read_watermarks.{user_id}': message_id
+                          for user_id, message_id in (duplicate.get('read_watermarks') or {}).items()}
+        update['$max']['updated_at'] = duplicate['updated_at']
+        keeper_last = keeper.get('last_message')
+        if last_message and (not keeper_last or last_message['message_id'] > keeper_last['message_id']):
+            update['$set'] = {'last_message': last_message}
+        rooms.update_one({'_id': keeper['_id']}, update)
+
+        rooms.delete_one({'_id': duplicate['_id']})
+        self.stdout.write(f"Merged room {duplicate['_id']} into {keeper['_id']}")
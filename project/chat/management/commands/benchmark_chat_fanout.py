@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.codec import CODECS
+from chat.consumers import ChatConsumer
+
+
+class Recipient(ChatConsumer):
+    """ChatConsumer whose socket writes go nowhere, so only handler cost is measured"""
+
+    def __init__(self):
+        pass
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        pass
+
+
+async def legacy_chat_message(consumer, event):
+    # The handler as it was before fan-out frames were pre-encoded: one encode per recipient
+    await consumer.send(text_data=json.dumps({
+        'type': 'message',
+        'message_id': event['message_id'],
+        'seq': event['seq'],
+        'sender_id': event['sender_id'],
+        'sender_name': event['sender_name'],
+        'content': event['content'],
+        'file_url': event['file_url'],
+        'file_type': event['file_type'],
+        'timestamp': event['timestamp']
+    }))
+
+
+class Command(BaseCommand):
+    help = 'Compare per-recipient encoding with pre-encoded fan-out frames for several chat group sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group-sizes', type=int, nargs='+', default=[2, 50, 500])
+        parser.add_argument('--messages', type=int, default=1000, help='Messages fanned out per measurement')
+        parser.add_argument('--content-length', type=int, default=200, help='Characters of message content')
+
+    def handle(self, *args, **options):
+        frame = {
+            'type': 'message',
+            'message_id': '6650f1e2a1b2c3d4e5f60718',
+            'seq': 12345,
+            'sender_id': '6650f1e2a1b2c3d4e5f60700',
+            'sender_name': 'Benchmark Sender',
+            'content': 'x' * options['content_length'],
+            'file_url': '',
+            'file_type': '',
+            'timestamp': datetime.datetime.now().isoformat()
+        }
+
+        self.stdout.write(f"{'group':>6} {'strategy':<22} {'total':>10} {'per message':>14}")
+        for size in options['group_sizes']:
+            recipients = [Recipient() for _ in range(size)]
+            results = [('per-recipient json', asyncio.run(self.per_recipient(recipients, frame, options['messages'])))]
+            for name, (dumps, _) in CODECS.items():
+                elapsed = asyncio.run(self.pre_encoded(recipients, frame, options['messages'], dumps))
+                results.append((f'pre-encoded {name}', elapsed))
+
+            for strategy, elapsed in results:
+                per_message_us = elapsed / options['messages'] * 1e6
+                self.stdout.write(f'{size:>6} {strategy:<22} {elapsed:>9.3f}s {per_message_us:>11.1f} us')
+
+    async def per_recipient(self, recipients, frame, messages):
+        event = dict(frame, type='chat_message')
+        start = time.perf_counter()
+        for _ in range(messages):
+            for recipient in recipients:
+                await legacy_chat_message(recipient, event)
+        return time.perf_counter() - start
+
+    async def pre_encoded(self, recipients, frame, messages, dumps):
+        start = time.perf_counter()
+        for _ in range(messages):
+            event = {'type': 'chat_message', 'text': dumps(frame)}
+            for recipient in recipients:
+                await recipient.chat_message(event)
+        return time.perf_counter() - start
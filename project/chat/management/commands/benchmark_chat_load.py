@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import json
+import time
+import uuid
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from chat.models import ChatRoom, ChatMessageBucket
+from chat.routing import websocket_urlpatterns
+from users.cache import invalidate_mongo_user
+from users.models import User, MongoUser
+
+# Django user ids given to benchmark senders; the users are never saved to the SQL database
+BENCHMARK_USER_ID_BASE = 10 ** 12
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure ChatConsumer throughput (messages/sec) with concurrent senders. '
+        'Uses the in-memory channel layer and writes to the configured MongoDB; '
+        'fixtures are removed afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, nargs='+', default=[1, 100, 1000],
+                            help='Concurrent sender counts to benchmark')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent by each sender')
+        parser.add_argument('--write-behind', action='store_true', help='Persist through the write-behind buffer')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for each echoed message')
+
+    def handle(self, *args, **options):
+        with override_settings(
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            CHAT_WRITE_BEHIND=options['write_behind'],
+            # Measure raw throughput: no throttling, no closing of sockets that fall behind
+            CHAT_RATE_LIMIT_CONNECTION_BURST=options['messages'],
+            CHAT_RATE_LIMIT_USER_BURST=options['messages'],
+            CHAT_SLOW_CONSUMER_MAX_LAG=float('inf')
+        ):
+            for senders in options['senders']:
+                fixtures = self.create_fixtures(senders)
+                try:
+                    elapsed = asyncio.run(self.run(fixtures, options['messages'], options['timeout']))
+                finally:
+                    self.delete_fixtures(fixtures)
+                total = senders * options['messages']
+                self.stdout.write(
+                    f'{senders:>5} senders  {total:>7} messages  {elapsed:8.3f}s  {total / elapsed:10.1f} msg/s'
+                )
+
+    def create_fixtures(self, senders):
+        # One room per sender, so the numbers reflect persistence rather than group fan-out
+        tag = uuid.uuid4().hex[:8]
+        now = datetime.datetime.now()
+        fixtures = []
+        for i in range(senders):
+            users = [
+                MongoUser(
+                    user_id=str(BENCHMARK_USER_ID_BASE + 2 * i + n),
+                    email=f'bench-{tag}-{i}-{n}@example.com',
+                    first_name='Bench',
+                    last_name=str(n),
+                    user_type='student'
+                ).save()
+                for n in (0, 1)
+            ]
+            room = ChatRoom(user1=users[0], user2=users[1], is_active=True, service_type='general',
+                            created_at=now, updated_at=now).save()
+            fixtures.append((room, users))
+        return fixtures
+
+    def delete_fixtures(self, fixtures):
+        room_ids = [room.id for room, _ in fixtures]
+        ChatMessageBucket.objects(room__in=room_ids).delete()
+        ChatRoom.objects(id__in=room_ids).delete()
+        MongoUser.objects(id__in=[user.id for _, users in fixtures for user in users]).delete()
+        # The next round reuses the same Django user ids for new MongoUsers
+        for _, users in fixtures:
+            for user in users:
+                invalidate_mongo_user(user.user_id, user.id)
+
+    async def run(self, fixtures, messages, timeout):
+        application = URLRouter(websocket_urlpatterns)
+        communicators = []
+        for room, users in fixtures:
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{room.id}/')
+            communicator.scope['user'] = User(id=int(users[0].user_id), email=users[0].email)
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError(f'Could not connect to room {room.id}')
+            # The consumer greets with the other participant's presence; only echoes should be counted
+            await communicator.receive_from(timeout=timeout)
+            communicators.append(communicator)
+
+        async def send_all(communicator):
+            for n in range(messages):
+                await communicator.send_to(text_data=json.dumps({
+                    'type': 'message',
+                    'content': f'benchmark message {n}',
+                }))
+            for _ in range(messages):
+                await communicator.receive_from(timeout=timeout)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send_all(c) for c in communicators))
+        elapsed = time.perf_counter() - start
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return elapsed
@@ -0,0 +1,77 @@
+import struct
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from chat.models import ChatRoom, ChatMessageBucket
+from chat.store import MESSAGES_PER_BUCKET
+
+
+class Command(BaseCommand):
+    help = 'Move messages embedded in chat_rooms documents into chat_message_buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Rooms loaded per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be migrated without writing')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        rooms = ChatRoom._get_collection()
+        buckets = ChatMessageBucket._get_collection()
+
+        migrated_rooms = 0
+        migrated_messages = 0
+        last_id = None
+        while True:
+            # Walk rooms in _id order so each batch is a cheap range scan
+            query = {'messages.0': {'$exists': True}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(rooms.find(query, {'messages': 1}).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+
+            for room in batch:
+                bucket_docs = self.build_buckets(room['_id'], room['messages'])
+                migrated_rooms += 1
+                migrated_messages += len(room['messages'])
+                if dry_run:
+                    continue
+                buckets.insert_many(bucket_docs, ordered=True)
+                # Seed the inbox summary from the migrated history
+                rooms.update_one({'_id': room['_id']}, {
+                    '$unset': {'messages': ''},
+                    '$set': {
+                        'message_count': len(room['messages']),
+                        'last_message': bucket_docs[-1]['messages'][-1],
+                    },
+                })
+
+            self.stdout.write(f'{migrated_rooms} rooms, {migrated_messages} messages processed')
+
+        action = 'Would migrate' if dry_run else 'Migrated'
+        self.stdout.write(self.style.SUCCESS(f'{action} {migrated_messages} messages from {migrated_rooms} rooms'))
+
+    def build_buckets(self, room_id, messages):
+        messages = sorted(messages, key=lambda m: m['timestamp'])
+        for position, message in enumerate(messages):
+            if not message.get('message_id'):
+                # Time-ordered id: embedded messages have no id, so derive one from timestamp and position
+                seconds = int(message['timestamp'].timestamp())
+                message['message_id'] = str(ObjectId(struct.pack('>IQ', seconds, position)))
+
+        bucket_docs = []
+        for start in range(0, len(messages), MESSAGES_PER_BUCKET):
+            chunk = messages[start:start + MESSAGES_PER_BUCKET]
+            bucket_docs.append({
+                'room': room_id,
+                'count': len(chunk),
+                'first_id': chunk[0]['message_id'],
+                'last_id': chunk[-1]['message_id'],
+                'first_timestamp': chunk[0]['timestamp'],
+                'last_timestamp': chunk[-1]['timestamp'],
+                'messages': chunk,
+            })
+        return bucket_docs
@@ -0,0 +1,57 @@
+"""
+In-process chat metrics.
+
+Counters, gauges and latency samples are kept per worker process and read
+through snapshot(), which backs the admin-only chat metrics endpoint.
+"""
+
+import threading
+from collections import defaultdict, deque
+
+# Latency samples kept per timing for percentile estimates
+SAMPLE_SIZE = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timing_counts = defaultdict(int)
+_timing_samples = defaultdict(lambda: deque(maxlen=SAMPLE_SIZE))
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    """Record one duration, in seconds, for the timing ``name``"""
+    with _lock:
+        _timing_counts[name] += 1
+        _timing_samples[name].append(seconds)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def snapshot():
+    with _lock:
+        timings = {}
+        for name, samples in _timing_samples.items():
+            ordered = sorted(samples)
+            timings[name] = {
+                'count': _timing_counts[name],
+                'p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+                'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': timings,
+        }
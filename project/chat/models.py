@@ -1,7 +1,9 @@
-from mongoengine import Document, StringField, ListField, DateTimeField, ReferenceField, CASCADE, BooleanField, EmbeddedDocument, EmbeddedDocumentField
+from mongoengine import Document, StringField, ListField, DateTimeField, ReferenceField, CASCADE, BooleanField, EmbeddedDocument, EmbeddedDocumentField, IntField, MapField
 
 class ChatMessage(EmbeddedDocument):
     """Individual chat message"""
+    message_id = StringField()  # ObjectId string; sortable, used as the pagination cursor
+    seq = IntField()  # Per-room sequence number
     sender_id = StringField(required=True)
     sender_name = StringField(required=True)
     content = StringField(required=True)
@@ -13,14 +15,26 @@ class ChatRoom(Document):
     """Chat room between two users"""
     user1 = ReferenceField('users.MongoUser', reverse_delete_rule=CASCADE, required=True)
     user2 = ReferenceField('users.MongoUser', reverse_delete_rule=CASCADE, required=True)
-    messages = ListField(EmbeddedDocumentField(ChatMessage))
+    messages = ListField(EmbeddedDocumentField(ChatMessage))  # Legacy embedded history, see migrate_chat_messages
     is_active = BooleanField(default=True)
     created_at = DateTimeField(required=True)
     updated_at = DateTimeField(required=True)
+    message_seq = IntField(default=0)  # Last sequence number handed out to a message of this room
+    
+    # Denormalized inbox summary, maintained atomically on every send
+    last_message = EmbeddedDocumentField(ChatMessage)
+    message_count = IntField(default=0)
+    unread_counts = MapField(IntField())  # MongoUser id -> messages not yet read by that participant
+    read_watermarks = MapField(StringField())  # MongoUser id -> message_id of the last message read
     
     # Additional fields to track service context
     service_type = StringField(choices=['repair', 'academic', 'general'])  # Type of service
     service_id = StringField()  # ID of related service (repair request or academic question)
+    room_key = StringField()  # Sorted participant pair plus service context, see chat.store.room_key
+    
+    # Set while the message history sits in cold storage, see chat.archive
+    archive_ref = StringField()
+    archived_at = DateTimeField()
     
     meta = {
         'collection': 'chat_rooms',
@@ -28,6 +42,36 @@ class ChatRoom(Document):
             'user1', 
             'user2', 
             'created_at',
-            ('user1', 'user2')  # Compound index
+            ('user1', 'user2'),  # Compound index
+            ('user1', '-updated_at'),  # Inbox listing
+            ('user2', '-updated_at'),
+            # One room per participant pair and service; sparse so rooms not yet backfilled are left out
+            {'fields': ['room_key'], 'unique': True, 'sparse': True}
+        ]
+    }
+
+class ChatMessageBucket(Document):
+    """A run of up to MESSAGES_PER_BUCKET consecutive messages of one chat room"""
+    room = ReferenceField(ChatRoom, reverse_delete_rule=CASCADE, required=True)
+    count = IntField(default=0)  # Number of messages in the bucket
+    is_open = BooleanField()  # Set on the one bucket of the room that takes new messages
+    first_id = StringField()  # message_id of the oldest message in the bucket
+    last_id = StringField()  # message_id of the newest message in the bucket
+    first_seq = IntField()  # Lowest message sequence number in the bucket
+    last_seq = IntField()  # Highest message sequence number in the bucket
+    first_timestamp = DateTimeField()
+    last_timestamp = DateTimeField()
+    messages = ListField(EmbeddedDocumentField(ChatMessage))
+
+    meta = {
+        'collection': 'chat_message_buckets',
+        'indexes': [
+            ('room', 'first_id'),  # Keyset pagination
+            ('room', 'last_id'),
+            # Locating the open bucket on append; at most one per room, so messages only ever go to the newest
+            {'fields': ['room'], 'unique': True, 'partialFilterExpression': {'is_open': True}},
+            ('room', 'last_seq'),  # Resuming after a sequence number
+            # Chat search; room as a suffix filters the caller's rooms inside the index. No stemming, see chat.search
+            {'fields': ['$messages.content', 'room'], 'default_language': 'none'}
         ]
     }
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Persistence path for ChatConsumer.
+
+``database_sync_to_async`` is thread-sensitive: every call from every
+connection is queued onto the one thread shared with the rest of the sync
+code, so chat writes run strictly one after another. Chat persistence only
+talks to MongoDB through mongoengine/pymongo, whose client is thread-safe, so
+it runs on a bounded pool of its own instead.
+"""
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+_executor = None
+
+
+def get_executor():
+    """Return the process-wide chat persistence pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'CHAT_PERSISTENCE_WORKERS', 16),
+            thread_name_prefix='chat-persistence'
+        )
+    return _executor
+
+
+def persistence_sync_to_async(func):
+    """Like database_sync_to_async, but runs ``func`` on the chat persistence pool"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await sync_to_async(func, thread_sensitive=False, executor=get_executor())(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,204 @@
+"""
+Presence tracking for chat users.
+
+Every open ChatConsumer socket is a presence connection that lives for
+CHAT_PRESENCE_TTL seconds and is renewed by the client's heartbeat frames; a
+heartbeat arriving after its connection expired registers it again. A user
+is online while at least one of their connections is alive, so several
+tabs or devices per user are handled naturally. Every socket also joins the
+presence group of the other participant of its room (watch_group). When a
+user comes online or goes offline (last socket closed, or its heartbeats
+stopped), one presence event goes to the user's presence group. So it
+reaches each of their peers in every shared room, whichever room the change
+came from.
+
+Two stores are available through CHAT_PRESENCE_STORE: 'memory' keeps state in
+the worker process and needs no Redis; 'redis' shares it between workers
+through CHAT_PRESENCE_REDIS_URL.
+"""
+
+import asyncio
+import time
+
+from django.conf import settings
+
+from chat import codec
+
+# Most user ids accepted by a single batch query
+MAX_BATCH_SIZE = 200
+
+
+def watch_group(user_id):
+    """Channel layer group of the sockets that follow the presence of ``user_id``"""
+    return f'presence_{user_id}'
+
+
+class InMemoryPresenceStore:
+    def __init__(self):
+        # user_id -> {(channel_name, group): expires_at}
+        self._connections = {}
+
+    def _live(self, user_id, now):
+        connections = self._connections.get(user_id, {})
+        return {member: expires for member, expires in connections.items() if expires > now}
+
+    async def add(self, user_id, channel_name, group, ttl):
+        """Register or renew a connection; return True if the user was offline until now"""
+        now = time.time()
+        live = self._live(user_id, now)
+        came_online = not live
+        live[(channel_name, group)] = now + ttl
+        self._connections[user_id] = live
+        return came_online
+
+    async def remove(self, user_id, channel_name, group):
+        """Drop a connection; return True if it was the user's last live one"""
+        now = time.time()
+        connections = self._connections.get(user_id)
+        if connections is None or connections.pop((channel_name, group), None) is None:
+            return False
+        live = self._live(user_id, now)
+        if live:
+            self._connections[user_id] = live
+            return False
+        del self._connections[user_id]
+        return True
+
+    async def online(self, user_ids):
+        now = time.time()
+        return {user_id for user_id in user_ids if self._live(user_id, now)}
+
+    async def expire(self):
+        """Drop stale connections; return {user_id: groups} for users that went offline"""
+        now = time.time()
+        offline = {}
+        for user_id, connections in list(self._connections.items()):
+            live = self._live(user_id, now)
+            if live:
+                self._connections[user_id] = live
+            else:
+                offline[user_id] = {group for _, group in connections}
+                del self._connections[user_id]
+        return offline
+
+
+class RedisPresenceStore:
+    """
+    Same contract as InMemoryPresenceStore, backed by Redis sorted sets.
+
+    ``presence:user:<id>`` holds the user's connections scored by expiry time,
+    and ``presence:expiry`` indexes every connection of every user so expired
+    ones can be found without scanning keys. Only the worker whose ZREM
+    actually removed a connection reports the resulting offline transition.
+    """
+    EXPIRY_KEY = 'presence:expiry'
+
+    def __init__(self, url):
+        from redis import asyncio as redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _user_key(user_id):
+        return f'presence:user:{user_id}'
+
+    async def add(self, user_id, channel_name, group, ttl):
+        now = time.time()
+        key = self._user_key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zcard(key)
+            pipe.zadd(key, {f'{channel_name}|{group}': now + ttl})
+            pipe.expire(key, int(ttl) + 1)
+            pipe.zadd(self.EXPIRY_KEY, {f'{user_id}|{channel_name}|{group}': now + ttl})
+            results = await pipe.execute()
+        return results[1] == 0
+
+    async def remove(self, user_id, channel_name, group):
+        key = self._user_key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(key, f'{channel_name}|{group}')
+            pipe.zrem(self.EXPIRY_KEY, f'{user_id}|{channel_name}|{group}')
+            pipe.zcount(key, time.time(), '+inf')
+            removed, _, remaining = await pipe.execute()
+        return removed == 1 and remaining == 0
+
+    async def online(self, user_ids):
+        user_ids = list(user_ids)
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(self._user_key(user_id), now, '+inf')
+            counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+    async def expire(self):
+        now = time.time()
+        offline = {}
+        for entry in await self.redis.zrangebyscore(self.EXPIRY_KEY, '-inf', now):
+            user_id, channel_name, group = entry.split('|', 2)
+            if await self.remove(user_id, channel_name, group):
+                offline.setdefault(user_id, set()).add(group)
+        return offline
+
+
+class PresenceService:
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+        self._sweepers = {}
+
+    async def connect(self, channel_layer, user_id, channel_name, group):
+        self._ensure_sweeper(channel_layer)
+        if await self.store.add(user_id, channel_name, group, self.ttl):
+            await self.announce(channel_layer, user_id, True)
+
+    async def heartbeat(self, channel_layer, user_id, channel_name, group):
+        # Re-registers the connection if the sweeper expired it, e.g. after a late heartbeat
+        if await self.store.add(user_id, channel_name, group, self.ttl):
+            await self.announce(channel_layer, user_id, True)
+
+    async def disconnect(self, channel_layer, user_id, channel_name, group):
+        if await self.store.remove(user_id, channel_name, group):
+            await self.announce(channel_layer, user_id, False)
+
+    async def online(self, user_ids):
+        """Return the subset of ``user_ids`` that is online"""
+        return await self.store.online(user_ids)
+
+    async def announce(self, channel_layer, user_id, is_online):
+        text = codec.dumps({'type': 'presence', 'user_id': user_id, 'online': is_online})
+        await channel_layer.group_send(watch_group(user_id), {'type': 'presence_update', 'text': text, 'sent_at': time.time()})
+
+    async def sweep(self, channel_layer):
+        """Expire connections whose heartbeats stopped and announce the users that went offline"""
+        for user_id in await self.store.expire():
+            await self.announce(channel_layer, user_id, False)
+
+    def _ensure_sweeper(self, channel_layer):
+        loop = asyncio.get_running_loop()
+        task = self._sweepers.get(loop)
+        if task is None or task.done():
+            self._sweepers[loop] = asyncio.ensure_future(self._sweep_forever(channel_layer))
+
+    async def _sweep_forever(self, channel_layer):
+        while True:
+            await asyncio.sleep(self.ttl / 2)
+            await self.sweep(channel_layer)
+
+
+_service = None
+
+
+def get_presence():
+    global _service
+    if _service is None:
+        backend = getattr(settings, 'CHAT_PRESENCE_STORE', 'memory')
+        if backend == 'redis':
+            store = RedisPresenceStore(settings.CHAT_PRESENCE_REDIS_URL)
+        elif backend == 'memory':
+            store = InMemoryPresenceStore()
+        else:
+            raise ValueError(f"Unknown chat presence store: {backend}")
+        _service = PresenceService(store, ttl=getattr(settings, 'CHAT_PRESENCE_TTL', 60))
+    return _service
@@ -0,0 +1,82 @@
+"""
+Token-bucket rate limiting for chat sockets.
+
+Each ChatConsumer gets a bucket of its own and shares a per-user bucket with
+the user's other sockets on the worker, so opening more tabs does not raise a
+user's allowance. Frames that hit the database or fan out to a room (messages,
+resumes, and typing frames that change or refresh the typing state) each take
+a token from both buckets; a frame that finds either bucket empty is rejected
+with an error frame instead of being processed.
+"""
+
+import time
+import weakref
+
+from django.conf import settings
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate  # Tokens added per second
+        self.burst = burst  # Bucket capacity
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def peek(self, tokens=1):
+        self._refill()
+        return self.tokens >= tokens
+
+    def consume(self, tokens=1):
+        """Take ``tokens`` if available; return whether they were"""
+        if not self.peek(tokens):
+            return False
+        self.tokens -= tokens
+        return True
+
+    def retry_after(self, tokens=1):
+        """Seconds until ``tokens`` will be available"""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+class ConnectionLimiter:
+    """The pair of buckets a single socket draws from"""
+
+    def __init__(self, connection_bucket, user_bucket):
+        self.connection_bucket = connection_bucket
+        self.user_bucket = user_bucket
+
+    def allow(self):
+        """Return (allowed, scope that ran dry, seconds until a retry can succeed)"""
+        # Check both before taking from either, so a rejected frame costs nothing
+        for scope, bucket in (('connection', self.connection_bucket), ('user', self.user_bucket)):
+            if not bucket.peek():
+                return False, scope, bucket.retry_after()
+        self.connection_bucket.consume()
+        self.user_bucket.consume()
+        return True, None, 0.0
+
+
+# user_id -> TokenBucket, alive as long as one of the user's sockets holds it
+_user_buckets = weakref.WeakValueDictionary()
+
+
+def get_limiter(user_id):
+    user_bucket = _user_buckets.get(user_id)
+    if user_bucket is None:
+        user_bucket = TokenBucket(
+            rate=getattr(settings, 'CHAT_RATE_LIMIT_USER_RATE', 10),
+            burst=getattr(settings, 'CHAT_RATE_LIMIT_USER_BURST', 40)
+        )
+        _user_buckets[user_id] = user_bucket
+
+    connection_bucket = TokenBucket(
+        rate=getattr(settings, 'CHAT_RATE_LIMIT_CONNECTION_RATE', 5),
+        burst=getattr(settings, 'CHAT_RATE_LIMIT_CONNECTION_BURST', 20)
+    )
+    return ConnectionLimiter(connection_bucket, user_bucket)
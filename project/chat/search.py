@@ -0,0 +1,83 @@
+"""
+Full-text search over chat history.
+
+Message buckets carry a text index on the content of their messages, built
+with language 'none' (no stemming, no stop words) so that every word the
+index matched can be found again in the message text. Room is a suffix of
+the index, so a search is a single $text query whose room filter is applied
+while walking the postings, however many rooms the caller has. MongoDB sorts
+the matching buckets newest first, and the search cuts the matching messages
+out of them with a highlighted snippet each.
+"""
+
+import re
+
+from chat.models import ChatMessageBucket
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Characters of context kept on each side of the first hit in a snippet
+SNIPPET_CONTEXT = 60
+
+
+def query_terms(query):
+    """Return the lower-cased words a text search for ``query`` matches on; negated words are skipped"""
+    terms = []
+    for token in query.split():
+        if not token.startswith('-'):
+            terms.extend(re.findall(r'\w+', token.lower()))
+    return terms
+
+
+def snippet(content, spans):
+    """Return (text around the first hit, [start, end] offsets of the hits within that text)"""
+    start = max(0, spans[0][0] - SNIPPET_CONTEXT)
+    end = min(len(content), spans[0][1] + SNIPPET_CONTEXT)
+    return content[start:end], [[a - start, b - start] for a, b in spans if a >= start and b <= end]
+
+
+def search_messages(room_ids, query, before=None, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Return up to ``limit`` messages of ``room_ids`` matching ``query``, newest
+    first, and whether more hits follow. ``before`` is the message_id cursor
+    of the previous page.
+    """
+    limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+    terms = query_terms(query)
+    if not terms or not room_ids:
+        return [], False
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+
+    filters = {'room__in': list(room_ids)}
+    if before:
+        filters['first_id__lt'] = before
+    # Newest first rather than by text score, so that pages follow the before=<message_id> cursor
+    buckets = ChatMessageBucket.objects(**filters).search_text(query).only(
+        'room', 'last_id', 'messages'
+    ).no_dereference().order_by('-last_id').batch_size(limit + 1)
+
+    hits = {}
+    ordered = []
+    for bucket in buckets:
+        # Buckets come newest first: once limit + 1 hits are newer than everything left, the page is complete
+        if len(ordered) > limit and bucket.last_id < ordered[limit]['message_id']:
+            break
+        for message in bucket.messages:
+            if (before and message.message_id >= before) or message.message_id in hits:
+                continue
+            spans = [match.span() for match in pattern.finditer(message.content)]
+            if not spans:
+                continue
+            text, highlights = snippet(message.content, spans)
+            hits[message.message_id] = {
+                'room_id': str(bucket.room.id),
+                'message_id': message.message_id,
+                'sender_id': message.sender_id,
+                'sender_name': message.sender_name,
+                'timestamp': message.timestamp,
+                'snippet': text,
+                'highlights': highlights,
+            }
+        ordered = sorted(hits.values(), key=lambda hit: hit['message_id'], reverse=True)
+
+    return ordered[:limit], len(ordered) > limit
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
 class ChatMessageSerializer(serializers.Serializer):
+    message_id = serializers.CharField()
+    seq = serializers.IntegerField(required=False, allow_null=True)
     sender_id = serializers.CharField()
     sender_name = serializers.CharField()
     content = serializers.CharField()
@@ -14,7 +16,6 @@ class ChatRoomSerializer(serializers.Serializer):
     user1_name = serializers.SerializerMethodField()
     user2_id = serializers.CharField(source='user2.id')
     user2_name = serializers.SerializerMethodField()
-    messages = ChatMessageSerializer(many=True)
     is_active = serializers.BooleanField()
     created_at = serializers.DateTimeField()
     updated_at = serializers.DateTimeField()
@@ -27,44 +28,53 @@ class ChatRoomSerializer(serializers.Serializer):
     def get_user2_name(self, obj):
         return f"{obj.user2.first_name} {obj.user2.last_name}"
 
+class ChatRoomSummarySerializer(serializers.Serializer):
+    """Inbox row: the other participant, the last message and the caller's unread count"""
+    id = serializers.CharField()
+    other_user_id = serializers.SerializerMethodField()
+    other_user_name = serializers.SerializerMethodField()
+    last_message = ChatMessageSerializer(allow_null=True)
+    message_count = serializers.IntegerField()
+    unread_count = serializers.SerializerMethodField()
+    is_active = serializers.BooleanField()
+    updated_at = serializers.DateTimeField()
+    service_type = serializers.CharField()
+    service_id = serializers.CharField()
+    
+    def _other_user_id(self, obj):
+        # user1/user2 are not dereferenced; names come from the batch loaded by the view
+        me = self.context['mongo_user_id']
+        return str(obj.user2.id if obj.user1.id == me else obj.user1.id)
+    
+    def get_other_user_id(self, obj):
+        return self._other_user_id(obj)
+    
+    def get_other_user_name(self, obj):
+        return self.context['user_names'].get(self._other_user_id(obj), '')
+    
+    def get_unread_count(self, obj):
+        return (obj.unread_counts or {}).get(str(self.context['mongo_user_id']), 0)
+
 class ChatRoomCreateSerializer(serializers.Serializer):
     user2_id = serializers.CharField()
     service_type = serializers.ChoiceField(choices=['repair', 'academic', 'general'])
     service_id = serializers.CharField(required=False, allow_blank=True)
     
     def create(self, validated_data):
-        from chat.models import ChatRoom
+        from chat.store import get_or_create_room
+        from users.cache import get_mongo_user
         from users.models import MongoUser
-        import datetime
         
-        user1_id = self.context['request'].user.id
-        user1 = MongoUser.objects(user_id=str(user1_id)).first()
+        user1 = get_mongo_user(self.context['request'])
         
         user2 = MongoUser.objects(id=validated_data['user2_id']).first()
         if not user2:
             raise serializers.ValidationError(f"User with ID {validated_data['user2_id']} not found")
         
-        # Check if a chat room already exists between these users
-        existing_room = ChatRoom.objects(
-            (Q(user1=user1) & Q(user2=user2)) | 
-            (Q(user1=user2) & Q(user2=user1))
-        ).first()
-        
-        if existing_room:
-            return existing_room
-        
-        now = datetime.datetime.now()
-        
-        chat_room = ChatRoom(
-            user1=user1,
-            user2=user2,
-            messages=[],
-            is_active=True,
-            service_type=validated_data['service_type'],
-            service_id=validated_data.get('service_id', ''),
-            created_at=now,
-            updated_at=now
-        )
-        
-        chat_room.save()
-        return chat_room
\ No newline at end of file
+        # Returns the existing room for this pair and service if there is one
+        return get_or_create_room(
+            user1,
+            user2,
+            validated_data['service_type'],
+            validated_data.get('service_id', '')
+        )
\ No newline at end of file
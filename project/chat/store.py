@@ -0,0 +1,325 @@
+"""
+Bucketed message storage for chat rooms.
+
+Messages live in ``chat_message_buckets``: each bucket document holds up to
+MESSAGES_PER_BUCKET consecutive messages of a single room, so appending a
+message is one small upsert and reading a page touches a handful of buckets
+instead of the whole room history.
+
+Only the room's open bucket (``is_open``, unique per room) takes new
+messages. Once it cannot take any more it is closed and the next append opens
+a new one, so a bucket never receives messages newer than those of a later
+bucket.
+"""
+
+import datetime
+
+from bson import ObjectId
+from mongoengine.errors import NotUniqueError
+from pymongo import UpdateOne
+
+from chat.models import ChatRoom, ChatMessageBucket
+
+MESSAGES_PER_BUCKET = 100
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+RESUME_CHUNK_SIZE = 100
+# Tries at appending when concurrent writers keep opening the next bucket first
+APPEND_ATTEMPTS = 3
+
+
+def new_message_id():
+    """Return a fresh, time-ordered message id"""
+    return str(ObjectId())
+
+
+def room_key(user_a_id, user_b_id, service_type, service_id=''):
+    """Return the key identifying the room of two participants for a service, whichever of them opens it"""
+    first, second = sorted((str(user_a_id), str(user_b_id)))
+    return f'{first}:{second}:{service_type}:{service_id or ""}'
+
+
+def get_or_create_room(user1, user2, service_type, service_id=''):
+    """
+    Return the room of two MongoUsers for a service, creating it if needed.
+
+    A single upsert on the unique room_key, so concurrent requests for the
+    same pair end up with the same room.
+    """
+    key = room_key(user1.id, user2.id, service_type, service_id)
+    now = datetime.datetime.now()
+    try:
+        return ChatRoom.objects(room_key=key).modify(
+            upsert=True,
+            new=True,
+            set_on_insert__user1=user1,
+            set_on_insert__user2=user2,
+            set_on_insert__is_active=True,
+            set_on_insert__service_type=service_type,
+            set_on_insert__service_id=service_id or '',
+            set_on_insert__created_at=now,
+            set_on_insert__updated_at=now
+        )
+    except NotUniqueError:
+        # Lost an insert race on the unique index; the winner's room is there now
+        return ChatRoom.objects(room_key=key).first()
+
+
+def append_message(room_id, message):
+    """Append a ChatMessage to the open bucket of a room, opening a new bucket when it is full"""
+    if not message.message_id:
+        message.message_id = new_message_id()
+
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            # Opens a bucket if the room has none; fails on the unique index if the open one is full
+            ChatMessageBucket.objects(room=room_id, is_open=True, count__lt=MESSAGES_PER_BUCKET).update_one(
+                push__messages=message,
+                inc__count=1,
+                set__last_id=message.message_id,
+                set__last_timestamp=message.timestamp,
+                min__first_seq=message.seq,
+                max__last_seq=message.seq,
+                set_on_insert__first_id=message.message_id,
+                set_on_insert__first_timestamp=message.timestamp,
+                upsert=True
+            )
+            return message
+        except NotUniqueError:
+            if attempt == APPEND_ATTEMPTS - 1:
+                raise
+            ChatMessageBucket.objects(room=room_id, is_open=True, count__gte=MESSAGES_PER_BUCKET).update(set__is_open=False)
+
+
+def record_message(room_id, message, recipient_id):
+    """
+    Update the room for a new message in one atomic update and return the
+    message's sequence number.
+
+    Increments the room's sequence counter, touches updated_at, replaces the
+    last_message snapshot, bumps the message count and the recipient's unread
+    counter, and moves the sender's read watermark to the message.
+    """
+    update = {
+        'set__updated_at': message.timestamp,
+        'set__last_message': message,
+        'inc__message_count': 1,
+        f'set__unread_counts__{message.sender_id}': 0,
+        f'set__read_watermarks__{message.sender_id}': message.message_id,
+    }
+    if recipient_id and recipient_id != message.sender_id:
+        update[f'inc__unread_counts__{recipient_id}'] = 1
+
+    room = ChatRoom.objects(id=room_id).only('message_seq').modify(inc__message_seq=1, new=True, **update)
+    if room is None:
+        raise ValueError(f"Chat room with ID {room_id} not found")
+    return room.message_seq
+
+
+def reserve_seqs(room_id, count):
+    """Reserve ``count`` consecutive sequence numbers of a room with one $inc and return the last"""
+    room = ChatRoom.objects(id=room_id).only('message_seq').modify(inc__message_seq=count, new=True)
+    if room is None:
+        raise ValueError(f"Chat room with ID {room_id} not found")
+    return room.message_seq
+
+
+def bulk_record(items):
+    """
+    Apply the room summary updates of many (room_id, ChatMessage, recipient_id)
+    triples, whose sequence numbers are already reserved, with a single
+    bulk_write.
+
+    Per room this has the effect of record_message for each message in turn:
+    a participant who sent in the batch has read up to their last message and
+    has unread only what the other sent after it. last_message only moves
+    forward, since another worker may flush newer messages of the room first.
+    """
+    by_room = {}
+    for room_id, message, recipient_id in items:
+        by_room.setdefault(ObjectId(room_id), []).append((message, recipient_id))
+
+    operations = []
+    for room_id, messages in by_room.items():
+        unread = {}  # Participants who sent in the batch -> messages from the other since their last one
+        read_up_to = {}
+        increments = {}  # Participants who did not send -> messages to add to their unread counter
+        for message, recipient_id in messages:
+            unread[message.sender_id] = 0
+            increments.pop(message.sender_id, None)  # Sending resets the counter, so earlier ones no longer add
+            read_up_to[message.sender_id] = message.message_id
+            if recipient_id and recipient_id != message.sender_id:
+                if recipient_id in unread:
+                    unread[recipient_id] += 1
+                else:
+                    increments[recipient_id] = increments.get(recipient_id, 0) + 1
+        update = {
+            '$inc': {'message_count': len(messages)},
+            '$set': {f'unread_counts.{user_id}': count for user_id, count in unread.items()},
+            '$max': {f'read_watermarks.{user_id}': message_id for user_id, message_id in read_up_to.items()},
+        }
+        for user_id, count in increments.items():
+            update['$inc'][f'unread_counts.{user_id}'] = count
+        operations.append(UpdateOne({'_id': room_id}, update))
+
+        last = max((message for message, _ in messages), key=lambda m: m.seq)
+        operations.append(UpdateOne(
+            {'_id': room_id, 'last_message.seq': {'$not': {'$gte': last.seq}}},
+            {'$set': {'last_message': last.to_mongo(), 'updated_at': last.timestamp}}
+        ))
+
+    if operations:
+        ChatRoom._get_collection().bulk_write(operations, ordered=False)
+    return len(by_room)
+
+
+def current_seq(room_id):
+    """Return the last sequence number handed out in a room, or None if the room does not exist"""
+    room = ChatRoom.objects(id=room_id).only('message_seq').first()
+    return room.message_seq if room else None
+
+
+def mark_read(room_id, user_id, attempts=3):
+    """Move a participant's read watermark to the room's last message and clear their unread counter"""
+    for _ in range(attempts):
+        room = ChatRoom.objects(id=room_id).only('last_message').first()
+        if room is None or room.last_message is None:
+            return None
+        last_id = room.last_message.message_id
+        # Only succeeds if no message arrived in between; otherwise re-read and try again
+        if ChatRoom.objects(id=room_id, last_message__message_id=last_id).update_one(**{
+            f'set__unread_counts__{user_id}': 0,
+            f'set__read_watermarks__{user_id}': last_id,
+        }):
+            return last_id
+    return None
+
+
+def bulk_append(items, skip_stored=False):
+    """
+    Persist many (room_id, ChatMessage) pairs with a single bulk_write.
+
+    Messages of a room are pushed with $each in arrival order. The first
+    chunk tops up the room's open bucket; an open bucket that has no room for
+    a chunk is closed first, so the upsert opens a new one. A concurrent
+    append in between fails the batch on the unique open-bucket index, and
+    the buffer retries it. With ``skip_stored``, messages a failed attempt
+    already stored are left out.
+    """
+    by_room = {}
+    for room_id, message in items:
+        if not message.message_id:
+            message.message_id = new_message_id()
+        by_room.setdefault(ObjectId(room_id), []).append(message)
+
+    collection = ChatMessageBucket._get_collection()
+    if skip_stored and by_room:
+        message_ids = [message.message_id for messages in by_room.values() for message in messages]
+        stored = {
+            (bucket['room'], message['message_id'])
+            for bucket in collection.find(
+                {'room': {'$in': list(by_room)}, 'messages.message_id': {'$in': message_ids}},
+                {'room': 1, 'messages.message_id': 1}
+            )
+            for message in bucket['messages']
+        }
+        for room_id in list(by_room):
+            by_room[room_id] = [m for m in by_room[room_id] if (room_id, m.message_id) not in stored]
+            if not by_room[room_id]:
+                del by_room[room_id]
+
+    open_counts = {
+        bucket['room']: bucket['count']
+        for bucket in collection.find({'room': {'$in': list(by_room)}, 'is_open': True}, {'room': 1, 'count': 1})
+    } if by_room else {}
+
+    operations = []
+    for room_id, messages in by_room.items():
+        # Fill what is left of the open bucket before opening the next one
+        free = MESSAGES_PER_BUCKET - open_counts.get(room_id, 0)
+        sizes = [free] if 0 < free < MESSAGES_PER_BUCKET else []
+        start = 0
+        while start < len(messages):
+            size = sizes.pop() if sizes else MESSAGES_PER_BUCKET
+            chunk = messages[start:start + size]
+            start += size
+            update = {
+                '$push': {'messages': {'$each': [m.to_mongo() for m in chunk]}},
+                '$inc': {'count': len(chunk)},
+                '$set': {'last_id': chunk[-1].message_id, 'last_timestamp': chunk[-1].timestamp},
+                '$setOnInsert': {'first_id': chunk[0].message_id, 'first_timestamp': chunk[0].timestamp},
+            }
+            seqs = [m.seq for m in chunk if m.seq is not None]
+            if seqs:
+                update['$min'] = {'first_seq': min(seqs)}
+                update['$max'] = {'last_seq': max(seqs)}
+            operations.append(UpdateOne(
+                {'room': room_id, 'is_open': True, 'count': {'$gt': MESSAGES_PER_BUCKET - len(chunk)}},
+                {'$set': {'is_open': False}}
+            ))
+            operations.append(UpdateOne(
+                {'room': room_id, 'is_open': True, 'count': {'$lte': MESSAGES_PER_BUCKET - len(chunk)}},
+                update,
+                upsert=True
+            ))
+
+    if operations:
+        collection.bulk_write(operations, ordered=True)
+    return len(operations)
+
+
+def get_messages(room_id, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return up to ``limit`` messages of a room in chronological order.
+
+    ``before`` and ``after`` are message_id cursors. Without cursors the most
+    recent page is returned. The second item of the result tells whether more
+    messages exist beyond the page in the direction being paged.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    if after:
+        buckets = ChatMessageBucket.objects(room=room_id, last_id__gt=after).order_by('first_id')
+        messages = _unique(_collect(buckets, lambda m: m.message_id > after, limit).values())
+        return messages[:limit], len(messages) > limit
+
+    query = {'room': room_id}
+    if before:
+        query['first_id__lt'] = before
+    buckets = ChatMessageBucket.objects(**query).order_by('-first_id')
+    messages = _unique(_collect(buckets, lambda m: not before or m.message_id < before, limit).values())
+    return messages[-limit:], len(messages) > limit
+
+
+def get_messages_after_seq(room_id, after_seq, limit=RESUME_CHUNK_SIZE):
+    """
+    Return up to ``limit`` messages of a room with a sequence number above
+    ``after_seq``, in sequence order, and whether more follow.
+    """
+    buckets = ChatMessageBucket.objects(room=room_id, last_seq__gt=after_seq).order_by('first_seq')
+    messages = _collect(buckets, lambda m: m.seq is not None and m.seq > after_seq, limit)
+    messages = sorted(messages.values(), key=lambda m: m.seq)
+    return messages[:limit], len(messages) > limit
+
+
+def _collect(buckets, keep, limit):
+    """
+    Gather the messages passing ``keep`` from ``buckets``, nearest first, by
+    message_id. Buckets may be partly filled, so they are read until more
+    than ``limit`` messages are in hand or none are left, plus one spare
+    bucket for messages whose ids were handed out just before the next
+    bucket opened.
+    """
+    messages = {}
+    spare = False
+    for bucket in buckets.batch_size(limit // MESSAGES_PER_BUCKET + 2):
+        messages.update((m.message_id, m) for m in bucket.messages if keep(m))
+        if spare:
+            break
+        spare = len(messages) > limit
+    return messages
+
+
+def _unique(messages):
+    """Sort messages by id, dropping copies left behind by a retried bulk write"""
+    return sorted({m.message_id: m for m in messages}.values(), key=lambda m: m.message_id)
@@ -0,0 +1,94 @@
+"""
+Server-side coalescing of typing indicators.
+
+Clients send a typing frame on every keystroke. Per user and room, only state
+changes (start/stop) are fanned out, plus at most one refresh of a running
+"typing" state every CHAT_TYPING_REFRESH_INTERVAL seconds. A user who stops
+sending typing frames without a stop (closed tab, lost network) is reported
+as stopped after CHAT_TYPING_EXPIRY seconds.
+"""
+
+import asyncio
+import time
+
+from django.conf import settings
+
+from chat import codec, metrics
+
+
+class TypingCoalescer:
+    def __init__(self, refresh_interval, expiry):
+        self.refresh_interval = refresh_interval
+        self.expiry = expiry
+        # (group, user_id) -> (monotonic time of the last forwarded "typing" event, expiry timer)
+        self._states = {}
+
+    def would_forward(self, group, user_id, is_typing):
+        """Whether a typing frame tells the room something new, and so costs a fan-out"""
+        state = self._states.get((group, user_id))
+        if not is_typing:
+            return state is not None
+        return state is None or time.monotonic() - state[0] >= self.refresh_interval
+
+    async def update(self, channel_layer, group, user_id, is_typing):
+        """Record a typing frame from a client and fan it out if it tells the room something new"""
+        metrics.incr('chat.typing.received')
+        key = (group, user_id)
+        state = self._states.get(key)
+        now = time.monotonic()
+
+        if not is_typing:
+            if state is None:
+                return  # Already reported as stopped
+            state[1].cancel()
+            del self._states[key]
+            await self._send(channel_layer, group, user_id, False)
+            return
+
+        forward = self.would_forward(group, user_id, True)
+        if state is not None:
+            state[1].cancel()
+        timer = asyncio.get_running_loop().call_later(self.expiry, self._expire, channel_layer, group, user_id)
+        self._states[key] = (now if forward else state[0], timer)
+        if forward:
+            await self._send(channel_layer, group, user_id, True)
+
+    async def stop(self, channel_layer, group, user_id):
+        """Report a user as stopped if they were typing, e.g. when their socket closes"""
+        state = self._states.pop((group, user_id), None)
+        if state is not None:
+            state[1].cancel()
+            await self._send(channel_layer, group, user_id, False)
+
+    def _expire(self, channel_layer, group, user_id):
+        if self._states.pop((group, user_id), None) is not None:
+            metrics.incr('chat.typing.expired')
+            asyncio.ensure_future(self._send(channel_layer, group, user_id, False))
+
+    async def _send(self, channel_layer, group, user_id, is_typing):
+        metrics.incr('chat.typing.forwarded')
+        await channel_layer.group_send(
+            group,
+            {
+                'type': 'typing_status',
+                'text': codec.dumps({
+                    'type': 'typing',
+                    'user_id': user_id,
+                    'is_typing': is_typing
+                }),
+                'sent_at': time.time()
+            }
+        )
+
+
+_coalescer = None
+
+
+def get_coalescer():
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = TypingCoalescer(
+            refresh_interval=getattr(settings, 'CHAT_TYPING_REFRESH_INTERVAL', 3),
+            expiry=getattr(settings, 'CHAT_TYPING_EXPIRY', 6)
+        )
+    return _coalescer
@@ -1,7 +1,12 @@
 from django.urls import path
-from .views import ChatRoomViewSet
+from .views import ChatRoomViewSet, ChatMetricsView, PresenceView, ChatSearchView
 
 urlpatterns = [
     path('rooms/', ChatRoomViewSet.as_view({'get': 'list', 'post': 'create'}), name='chat-room-list'),
     path('rooms/<str:pk>/', ChatRoomViewSet.as_view({'get': 'retrieve'}), name='chat-room-detail'),
+    path('rooms/<str:pk>/messages/', ChatRoomViewSet.as_view({'get': 'messages'}), name='chat-room-messages'),
+    path('rooms/<str:pk>/read/', ChatRoomViewSet.as_view({'post': 'read'}), name='chat-room-read'),
+    path('search/', ChatSearchView.as_view(), name='chat-search'),
+    path('presence/', PresenceView.as_view(), name='chat-presence'),
+    path('metrics/', ChatMetricsView.as_view(), name='chat-metrics'),
 ]
\ No newline at end of file
@@ -1,26 +1,52 @@
+import time
+
+from asgiref.sync import async_to_sync
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.views import APIView
+from rest_framework.pagination import PageNumberPagination
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from mongoengine.queryset.visitor import Q
 
 from .models import ChatRoom
-from .serializers import ChatRoomSerializer, ChatRoomCreateSerializer
+from .serializers import ChatRoomSerializer, ChatRoomCreateSerializer, ChatMessageSerializer, ChatRoomSummarySerializer
+from .archive import ensure_hot
+from .store import get_messages, mark_read, DEFAULT_PAGE_SIZE
+from .presence import get_presence, MAX_BATCH_SIZE
+from .search import search_messages, DEFAULT_SEARCH_LIMIT
+from . import metrics
+from users.cache import get_mongo_user
 from users.models import MongoUser
 
+# Fields the inbox listing needs; the rest of the room document is never loaded
+SUMMARY_FIELDS = (
+    'user1', 'user2', 'last_message', 'message_count', 'unread_counts',
+    'is_active', 'updated_at', 'service_type', 'service_id'
+)
+
 class ChatRoomViewSet(viewsets.ViewSet):
     def list(self, request):
-        user_id = request.user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(request)
+        
+        # Get the user's chat rooms, most recently active first, projected to summary fields only
+        chat_rooms = ChatRoom.objects(Q(user1=mongo_user) | Q(user2=mongo_user)).only(*SUMMARY_FIELDS).no_dereference().order_by('-updated_at')
         
-        # Get all chat rooms where the user is a participant
-        chat_rooms = ChatRoom.objects(Q(user1=mongo_user) | Q(user2=mongo_user))
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(chat_rooms, request, view=self)
         
-        serialized_data = []
-        for room in chat_rooms:
-            serializer = ChatRoomSerializer(room)
-            serialized_data.append(serializer.data)
+        # Load the other participants' names for the whole page in one query
+        other_ids = {room.user2.id if room.user1.id == mongo_user.id else room.user1.id for room in page}
+        user_names = {
+            str(user.id): f"{user.first_name} {user.last_name}"
+            for user in MongoUser.objects(id__in=list(other_ids)).only('first_name', 'last_name')
+        }
         
-        return Response(serialized_data)
+        serializer = ChatRoomSummarySerializer(page, many=True, context={
+            'mongo_user_id': mongo_user.id,
+            'user_names': user_names
+        })
+        return paginator.get_paginated_response(serializer.data)
     
     def create(self, request):
         serializer = ChatRoomCreateSerializer(data=request.data, context={'request': request})
@@ -31,10 +57,9 @@ class ChatRoomViewSet(viewsets.ViewSet):
     
     def retrieve(self, request, pk=None):
         try:
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
-            chat_room = ChatRoom.objects(id=pk).first()
+            chat_room = ChatRoom.objects(id=pk).exclude('messages').first()
             if not chat_room:
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
@@ -42,7 +67,127 @@ class ChatRoomViewSet(viewsets.ViewSet):
             if str(chat_room.user1.id) != str(mongo_user.id) and str(chat_room.user2.id) != str(mongo_user.id):
                 return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
             
+            # Bring the history back from cold storage before it is paged through
+            ensure_hot(chat_room)
+            
             serializer = ChatRoomSerializer(chat_room)
             return Response(serializer.data)
         except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        try:
+            mongo_user = get_mongo_user(request)
+            
+            chat_room = ChatRoom.objects(id=pk).only('user1', 'user2', 'archive_ref').no_dereference().first()
+            if not chat_room:
+                return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+            
+            # Check if user is a participant in this chat room
+            if chat_room.user1.id != mongo_user.id and chat_room.user2.id != mongo_user.id:
+                return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
+            
+            ensure_hot(chat_room)
+            
+            before = request.query_params.get('before')
+            after = request.query_params.get('after')
+            if before and after:
+                return Response({"detail": "Use either before or after, not both"}, status=status.HTTP_400_BAD_REQUEST)
+            limit = request.query_params.get('limit', DEFAULT_PAGE_SIZE)
+            
+            messages, has_more = get_messages(chat_room.id, before=before, after=after, limit=limit)
+            return Response({
+                'results': ChatMessageSerializer(messages, many=True).data,
+                'has_more': has_more,
+                'before': messages[0].message_id if messages else before,
+                'after': messages[-1].message_id if messages else after
+            })
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        try:
+            mongo_user = get_mongo_user(request)
+            
+            chat_room = ChatRoom.objects(id=pk).only('user1', 'user2').no_dereference().first()
+            if not chat_room:
+                return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+            
+            # Check if user is a participant in this chat room
+            if chat_room.user1.id != mongo_user.id and chat_room.user2.id != mongo_user.id:
+                return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
+            
+            last_read_id = mark_read(chat_room.id, str(mongo_user.id))
+            return Response({'last_read_message_id': last_read_id, 'unread_count': 0})
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class ChatMetricsView(APIView):
+    # is_staff is not among the token claims; check it against the database
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
+class PresenceView(APIView):
+    """Batch presence query: which of these (up to MAX_BATCH_SIZE) MongoUser ids are online"""
+    
+    def get(self, request):
+        user_ids = [i for i in request.query_params.get('user_ids', '').split(',') if i]
+        return self.respond(user_ids)
+    
+    def post(self, request):
+        user_ids = request.data.get('user_ids', [])
+        if not isinstance(user_ids, list):
+            return Response({"detail": "user_ids must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.respond([str(i) for i in user_ids])
+    
+    def respond(self, user_ids):
+        if len(user_ids) > MAX_BATCH_SIZE:
+            return Response({"detail": f"At most {MAX_BATCH_SIZE} user ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+        online = async_to_sync(get_presence().online)(user_ids)
+        return Response({user_id: user_id in online for user_id in user_ids})
+
+
+class ChatSearchView(APIView):
+    """Full-text search over the messages of the rooms the caller participates in"""
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        mongo_user = get_mongo_user(request)
+        if not mongo_user:
+            return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        room_ids = set(ChatRoom.objects(Q(user1=mongo_user) | Q(user2=mongo_user)).scalar('id'))
+        
+        room_id = request.query_params.get('room')
+        if room_id:
+            room_ids = {pk for pk in room_ids if str(pk) == room_id}
+            if not room_ids:
+                return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
+        
+        start = time.perf_counter()
+        try:
+            results, has_more = search_messages(
+                room_ids,
+                query,
+                before=request.query_params.get('before'),
+                limit=request.query_params.get('limit', DEFAULT_SEARCH_LIMIT)
+            )
+        except ValueError:
+            return Response({"detail": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+        metrics.observe('chat.search', time.perf_counter() - start)
+        
+        return Response({
+            'results': results,
+            'has_more': has_more,
+            # Cursor for the next page
+            'before': results[-1]['message_id'] if has_more else None
+        })
\ No newline at end of file
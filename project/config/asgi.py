@@ -5,15 +5,19 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from chat.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+# Set up Django before importing anything that touches models or settings
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from chat.routing import websocket_urlpatterns
+from users.middleware import JWTAuthMiddlewareStack
+
 application = ProtocolTypeRouter({
-    'http': get_asgi_application(),
-    'websocket': AuthMiddlewareStack(
+    'http': django_asgi_app,
+    'websocket': JWTAuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
@@ -139,7 +139,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -164,6 +164,40 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# WebSocket JWT auth: verified tokens cached per worker to absorb reconnect storms
+WEBSOCKET_AUTH_CACHE_SIZE = int(os.getenv('WEBSOCKET_AUTH_CACHE_SIZE', 10000))
+WEBSOCKET_AUTH_CACHE_TTL = int(os.getenv('WEBSOCKET_AUTH_CACHE_TTL', 300))  # seconds
+
+# Per-process cache of Django user id -> MongoUser lookups (seconds a cached document may be stale)
+MONGO_USER_CACHE_SIZE = int(os.getenv('MONGO_USER_CACHE_SIZE', 10000))
+MONGO_USER_CACHE_TTL = int(os.getenv('MONGO_USER_CACHE_TTL', 60))
+
+# Shared cache for all workers when CACHE_REDIS_URL is set, otherwise a per-process cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL'),
+    } if os.getenv('CACHE_REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a cached page of the teacher/technician directory may be served
+EXPERT_DIRECTORY_CACHE_TTL = int(os.getenv('EXPERT_DIRECTORY_CACHE_TTL', 60))
+
+# Matching new questions and repair requests to experts: suggestions stored per item, rating
+# points an expert loses per open item, and how often each worker's index re-reads changes
+# and is rebuilt, both in the background (seconds)
+MATCHING_SUGGESTIONS = int(os.getenv('MATCHING_SUGGESTIONS', 5))
+MATCHING_WORKLOAD_WEIGHT = float(os.getenv('MATCHING_WORKLOAD_WEIGHT', 0.25))
+MATCHING_INDEX_REFRESH = float(os.getenv('MATCHING_INDEX_REFRESH', 30))
+MATCHING_INDEX_MAX_AGE = float(os.getenv('MATCHING_INDEX_MAX_AGE', 600))
+
+# Expert leaderboard: ratings are shrunk towards LEADERBOARD_PRIOR_RATING as if every expert
+# had LEADERBOARD_PRIOR_WEIGHT extra reviews of that rating
+LEADERBOARD_PRIOR_RATING = float(os.getenv('LEADERBOARD_PRIOR_RATING', 3.5))
+LEADERBOARD_PRIOR_WEIGHT = float(os.getenv('LEADERBOARD_PRIOR_WEIGHT', 10))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # React frontend
@@ -180,6 +214,47 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat persistence: size of the thread pool ChatConsumer writes run on
+CHAT_PERSISTENCE_WORKERS = int(os.getenv('CHAT_PERSISTENCE_WORKERS', 16))
+
+# Chat write-behind: fan messages out immediately and persist them in batches
+CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'False') == 'True'
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('CHAT_WRITE_BEHIND_FLUSH_INTERVAL', 0.01))  # seconds
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BEHIND_BATCH_SIZE', 200))
+CHAT_WRITE_BEHIND_MAX_PENDING = int(os.getenv('CHAT_WRITE_BEHIND_MAX_PENDING', 10000))
+
+# JSON codec for chat frames: 'auto' (orjson when installed), 'orjson' or 'json'
+CHAT_JSON_CODEC = os.getenv('CHAT_JSON_CODEC', 'auto')
+
+# Typing indicators: refresh a running "typing" state at most this often, expire it after this long (seconds)
+CHAT_TYPING_REFRESH_INTERVAL = float(os.getenv('CHAT_TYPING_REFRESH_INTERVAL', 3))
+CHAT_TYPING_EXPIRY = float(os.getenv('CHAT_TYPING_EXPIRY', 6))
+
+# Chat presence: 'memory' (per worker, no Redis needed) or 'redis' (shared between workers)
+CHAT_PRESENCE_STORE = os.getenv('CHAT_PRESENCE_STORE', 'memory')
+CHAT_PRESENCE_REDIS_URL = os.getenv(
+    'CHAT_PRESENCE_REDIS_URL',
+    f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', 6379)}/0"
+)
+CHAT_PRESENCE_TTL = int(os.getenv('CHAT_PRESENCE_TTL', 60))  # seconds; clients heartbeat well within this
+
+# Reconnect resync: largest gap (in messages) streamed over the socket before the client is told to page over REST
+CHAT_RESUME_MAX_MESSAGES = int(os.getenv('CHAT_RESUME_MAX_MESSAGES', 1000))
+
+# Chat rate limiting: token buckets (frames per second, burst size) for message and resume frames
+CHAT_RATE_LIMIT_CONNECTION_RATE = float(os.getenv('CHAT_RATE_LIMIT_CONNECTION_RATE', 5))
+CHAT_RATE_LIMIT_CONNECTION_BURST = int(os.getenv('CHAT_RATE_LIMIT_CONNECTION_BURST', 20))
+CHAT_RATE_LIMIT_USER_RATE = float(os.getenv('CHAT_RATE_LIMIT_USER_RATE', 10))
+CHAT_RATE_LIMIT_USER_BURST = int(os.getenv('CHAT_RATE_LIMIT_USER_BURST', 40))
+
+# Close chat sockets whose room events arrive more than this many seconds after being sent
+CHAT_SLOW_CONSUMER_MAX_LAG = float(os.getenv('CHAT_SLOW_CONSUMER_MAX_LAG', 5))
+
+# Chat archiving: move the history of rooms idle this many days to 'local' segment files or 'gridfs'
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 180))
+CHAT_ARCHIVE_BACKEND = os.getenv('CHAT_ARCHIVE_BACKEND', 'local')
+CHAT_ARCHIVE_DIR = os.getenv('CHAT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'chat_archive'))
+
 # File upload settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
\ No newline at end of file
@@ -32,6 +32,7 @@ urlpatterns = [
     path('api/academic/', include('academic.urls')),
     path('api/resources/', include('resources.urls')),
     path('api/reviews/', include('reviews.urls')),
+    path('api/chat/', include('chat.urls')),
 ]
 
 # Serve media files in development
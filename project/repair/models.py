@@ -28,6 +28,7 @@ class RepairRequest(Document):
     status = StringField(required=True, choices=[
         'pending', 'assigned', 'in_progress', 'completed', 'cancelled'
     ], default='pending')
+    suggested_technicians = ListField(ReferenceField('users.MongoUser'))  # Best matching technicians when created, best first
     price_quote = StringField()  # Price quoted by technician
     payment_status = StringField(choices=['unpaid', 'paid'], default='unpaid')
     created_at = DateTimeField(required=True)
@@ -40,7 +41,8 @@ class RepairRequest(Document):
             'student', 
             'technician', 
             'status', 
-            'created_at'
+            'created_at',
+            ('suggested_technicians', 'status')
         ]
     }
 
@@ -23,11 +23,10 @@ class RepairRequestCreateSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from repair.models import RepairRequest
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         import datetime
         
-        user_id = self.context['request'].user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         media_data = validated_data.pop('media', [])
         now = datetime.datetime.now()
@@ -45,6 +44,10 @@ class RepairRequestCreateSerializer(serializers.Serializer):
             media=[]
         )
         
+        # Route the new item to the technicians best suited to its device type
+        from users.matching import match_experts
+        repair_request.suggested_technicians = match_experts('technician', validated_data['device_type'])
+        
         # Add media if provided
         for media_item in media_data:
             from repair.models import RepairMedia
@@ -82,6 +85,12 @@ class RepairRequestUpdateSerializer(serializers.Serializer):
     price_quote = serializers.CharField(required=False)
     payment_status = serializers.ChoiceField(choices=['unpaid', 'paid'], required=False)
     
+    def validate_price_quote(self, value):
+        # Quotes become earning amounts once paid, so they must be plain numbers
+        from users.earnings import parse_amount
+        parse_amount(value)
+        return value
+    
     def update(self, instance, validated_data):
         for attr, value in validated_data.items():
             if attr == 'technician_id':
@@ -123,27 +132,21 @@ class RepairRequestUpdateSerializer(serializers.Serializer):
             )
             instance.messages.append(message)
             
-            # Update technician's completed services count
-            if instance.technician:
-                from users.models import ExpertProfile
-                expert_profile = ExpertProfile.objects(user=instance.technician).first()
-                if expert_profile:
-                    completed = int(expert_profile.completed_services)
-                    expert_profile.completed_services = str(completed + 1)
-                    expert_profile.save()
-            
-            # Create earning record if payment_status is paid
+            # Create earning record if payment_status is paid; first, as an invalid quote stops the update
             if instance.payment_status == 'paid' and instance.technician and instance.price_quote:
-                from users.models import EarningRecord
-                earning = EarningRecord(
+                from users.earnings import create_earning
+                create_earning(
                     expert=instance.technician,
                     amount=instance.price_quote,
                     service_type='repair',
                     service_id=str(instance.id),
-                    date=datetime.datetime.now(),
                     is_paid=True
                 )
-                earning.save()
+            
+            # Update technician's completed services count
+            if instance.technician:
+                from users.experts import record_completed_service
+                record_completed_service(instance.technician)
         
         instance.updated_at = datetime.datetime.now()
         instance.save()
@@ -183,10 +186,9 @@ class RepairMessageCreateSerializer(serializers.Serializer):
     
     def create(self, validated_data, repair_request_id):
         from repair.models import RepairRequest, RepairMessage
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        user = self.context['request'].user
-        mongo_user = MongoUser.objects(user_id=str(user.id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         repair_request = RepairRequest.objects(id=repair_request_id).first()
         if not repair_request:
@@ -222,10 +224,9 @@ class RepairSolutionSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from repair.models import RepairSolution, RepairRequest, RepairMedia
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        user = self.context['request'].user
-        mongo_user = MongoUser.objects(user_id=str(user.id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         repair_request_id = validated_data.pop('repair_request_id')
         repair_request = RepairRequest.objects(id=repair_request_id).first()
@@ -12,7 +12,8 @@ from .serializers import (
     RepairMessageCreateSerializer,
     RepairSolutionSerializer
 )
-from users.models import MongoUser
+from users.cache import get_mongo_user
+from users.directory import directory_page
 
 class RepairRequestViewSet(viewsets.ViewSet):
     def get_permissions(self):
@@ -21,8 +22,7 @@ class RepairRequestViewSet(viewsets.ViewSet):
         return [permissions.IsAuthenticated()]
     
     def list(self, request):
-        user_id = request.user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(request)
         
         # Filter requests based on user role
         if request.user.user_type == 'student':
@@ -31,6 +31,9 @@ class RepairRequestViewSet(viewsets.ViewSet):
             # Technicians see both assigned requests and unassigned requests they can take
             assigned_requests = RepairRequest.objects(technician=mongo_user)
             unassigned_requests = RepairRequest.objects(technician=None, status='pending')
+            # ?matched=true: only the pending requests this technician was suggested for
+            if request.query_params.get('matched') in ('1', 'true'):
+                unassigned_requests = unassigned_requests.filter(suggested_technicians=mongo_user.id)
             repair_requests = list(assigned_requests) + list(unassigned_requests)
         else:
             return Response({"detail": "Unauthorized user type"}, status=status.HTTP_403_FORBIDDEN)
@@ -60,8 +63,7 @@ class RepairRequestViewSet(viewsets.ViewSet):
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user is authorized to view this request
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             is_student_owner = str(repair_request.student.id) == str(mongo_user.id)
             is_assigned_technician = repair_request.technician and str(repair_request.technician.id) == str(mongo_user.id)
@@ -82,8 +84,7 @@ class RepairRequestViewSet(viewsets.ViewSet):
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user is authorized to update this request
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             is_student_owner = str(repair_request.student.id) == str(mongo_user.id)
             is_assigned_technician = repair_request.technician and str(repair_request.technician.id) == str(mongo_user.id)
@@ -121,24 +122,12 @@ class RepairRequestViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def list_technicians(self, request):
-        # Get all technicians for student to view
-        technicians = MongoUser.objects(user_type='technician')
-        
-        technician_list = []
-        for tech in technicians:
-            from users.models import ExpertProfile
-            profile = ExpertProfile.objects(user=tech).first()
-            technician_list.append({
-                'id': str(tech.id),
-                'name': f"{tech.first_name} {tech.last_name}",
-                'expertise_areas': profile.expertise_areas if profile else "",
-                'experience_years': profile.experience_years if profile else "0",
-                'hourly_rate': profile.hourly_rate if profile else "0",
-                'rating': profile.rating if profile else "0.0",
-                'completed_services': profile.completed_services if profile else "0"
-            })
-        
-        return Response(technician_list)
+        # Page of technicians for students to browse, cached; ?page=&page_size=&area=&ordering=-rating
+        # &max_hourly_rate=&min_rating=&min_experience_years=
+        try:
+            return Response(directory_page(request, 'technician'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RepairSolutionViewSet(viewsets.ViewSet):
@@ -159,8 +148,7 @@ class RepairSolutionViewSet(viewsets.ViewSet):
                 return Response({"detail": "Repair request not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check authorization
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             is_student_owner = str(repair_request.student.id) == str(mongo_user.id)
             is_assigned_technician = repair_request.technician and str(repair_request.technician.id) == str(mongo_user.id)
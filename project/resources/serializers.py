@@ -28,9 +28,9 @@ class ResourceSerializer(serializers.Serializer):
             return False
         
         from resources.models import ResourceBookmark
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        mongo_user = MongoUser.objects(user_id=str(request.user.id)).first()
+        mongo_user = get_mongo_user(request)
         if not mongo_user:
             return False
         
@@ -38,10 +38,9 @@ class ResourceSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from resources.models import Resource
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        user_id = self.context['request'].user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         now = datetime.datetime.now()
         
@@ -79,10 +78,9 @@ class ResourceBookmarkSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from resources.models import ResourceBookmark, Resource
-        from users.models import MongoUser
+        from users.cache import get_mongo_user
         
-        user_id = self.context['request'].user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         resource_id = validated_data['resource_id']
         resource = Resource.objects(id=resource_id).first()
@@ -6,7 +6,7 @@ from mongoengine.queryset.visitor import Q
 
 from .models import Resource, ResourceBookmark
 from .serializers import ResourceSerializer, ResourceBookmarkSerializer
-from users.models import MongoUser
+from users.cache import get_mongo_user
 
 class ResourceViewSet(viewsets.ViewSet):
     def get_permissions(self):
@@ -71,8 +71,7 @@ class ResourceViewSet(viewsets.ViewSet):
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user is the author
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             if str(resource.author.id) != str(mongo_user.id):
                 return Response({"detail": "Only the author can update this resource"}, status=status.HTTP_403_FORBIDDEN)
@@ -92,8 +91,7 @@ class ResourceViewSet(viewsets.ViewSet):
                 return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
             
             # Check if user is the author
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             if str(resource.author.id) != str(mongo_user.id):
                 return Response({"detail": "Only the author can delete this resource"}, status=status.HTTP_403_FORBIDDEN)
@@ -126,8 +124,7 @@ class ResourceViewSet(viewsets.ViewSet):
 
 class ResourceBookmarkViewSet(viewsets.ViewSet):
     def list(self, request):
-        user_id = request.user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(request)
         
         # Get all bookmarks for this user
         bookmarks = ResourceBookmark.objects(user=mongo_user)
@@ -151,8 +148,7 @@ class ResourceBookmarkViewSet(viewsets.ViewSet):
     
     def destroy(self, request, pk=None):
         try:
-            user_id = request.user.id
-            mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+            mongo_user = get_mongo_user(request)
             
             resource = Resource.objects(id=pk).first()
             if not resource:
@@ -0,0 +1,132 @@
+import datetime
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from reviews.models import Review
+from users.models import User, MongoUser
+
+# Queries one page may cost: the page, its users, and the MongoUser lookup of the endpoint
+MAX_QUERIES_PER_PAGE = 3
+
+
+@contextmanager
+def count_mongo_queries():
+    """Count find, aggregate and count commands sent to MongoDB, per collection"""
+    counts = Counter()
+    Collection = type(Review._get_collection())
+    originals = {name: getattr(Collection, name) for name in ('find', 'aggregate', 'count_documents')}
+
+    def counting(name):
+        def method(collection, *args, **kwargs):
+            counts[collection.name] += 1
+            return originals[name](collection, *args, **kwargs)
+        return method
+
+    with mock.patch.multiple(Collection, **{name: counting(name) for name in originals}):
+        yield counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that each review listing endpoint costs a constant number of MongoDB queries per page, '
+        'however many reviewers the page has'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=120, help='Throwaway reviews to page through')
+        parser.add_argument('--limit', type=int, default=50, help='Page size')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        expert = self.create_user(f'{tag}-expert', 'technician')
+        reviewers = [self.create_user(f'{tag}-reviewer-{i}', 'student') for i in range(10)]
+        created_at = datetime.datetime.now()
+        # Every reviewer reviews many times, several in the same millisecond, to exercise the keyset tie-break
+        reviews = [
+            Review(
+                user=reviewers[i % len(reviewers)][1],
+                expert=expert[1],
+                service_type='repair',
+                service_id=f'{tag}-{i}',
+                rating=i % 5 + 1,
+                comment='Query count check',
+                created_at=created_at - datetime.timedelta(milliseconds=i // 3)
+            ).save()
+            for i in range(options['reviews'])
+        ]
+
+        try:
+            # Requested by URL, so a route shadowed by another one fails the check too
+            endpoints = [
+                ('review-list', reviewers[0][0], {'expert_id': str(expert[1].id)}),
+                ('my-reviews', reviewers[0][0], {}),
+                ('expert-reviews', expert[0], {}),
+            ]
+            failures = []
+            for name, user, params in endpoints:
+                pages, seen, worst = self.page_through(reverse(name), name, user, params, options['limit'])
+                self.stdout.write(f'{name:<16} {pages:>3} pages {seen:>5} reviews {worst:>3} queries per page at most')
+                if worst > MAX_QUERIES_PER_PAGE:
+                    failures.append(f'{name} made {worst} queries for one page')
+            expected = options['reviews']
+            if seen != expected:
+                failures.append(f'expert-reviews paged through {seen} of {expected} reviews')
+        finally:
+            Review.objects(id__in=[review.id for review in reviews]).delete()
+            for user, mongo_user in [expert] + reviewers:
+                mongo_user.delete()
+                user.delete()
+
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Review listings make a constant number of queries per page'))
+
+    def create_user(self, name, user_type):
+        user = User.objects.create_user(
+            email=f'check-reviews-{name}@example.com',
+            password=uuid.uuid4().hex,
+            first_name='Check',
+            last_name=name,
+            user_type=user_type
+        )
+        mongo_user = MongoUser(
+            user_id=str(user.id),
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            user_type=user_type
+        ).save()
+        return user, mongo_user
+
+    def page_through(self, path, name, user, params, limit):
+        """Fetch every page of ``path``; return (pages, distinct reviews seen, most queries made for one page)"""
+        match = resolve(path)
+        if match.url_name != name:
+            raise CommandError(f'{path} is routed to {match.url_name}, not {name}')
+        factory = APIRequestFactory()
+        pages = 0
+        seen = set()
+        worst = 0
+        before = None
+        while True:
+            query = dict(params, limit=limit)
+            if before:
+                query['before'] = before
+            request = factory.get(path, query)
+            force_authenticate(request, user=user)
+            with count_mongo_queries() as counts:
+                response = match.func(request, *match.args, **match.kwargs)
+            if response.status_code != 200:
+                raise CommandError(f'{response.status_code}: {response.data}')
+            pages += 1
+            worst = max(worst, sum(counts.values()))
+            seen.update(review['id'] for review in response.data['results'])
+            before = response.data['before']
+            if not before:
+                return pages, len(seen), worst
@@ -0,0 +1,92 @@
+import datetime
+from collections import defaultdict
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from pymongo import DeleteOne, ReplaceOne
+
+from reviews.models import Review, RatingAggregate
+from users.directory import invalidate_directory
+from users.models import ExpertProfile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating aggregates and expert ratings from the reviews, reporting any that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expert', default=None, help='Rebuild only the aggregates of this MongoUser id')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted aggregates without writing')
+
+    def handle(self, *args, **options):
+        match = {}
+        if options['expert']:
+            match['expert'] = ObjectId(options['expert'])
+
+        # Reviews per expert, service type and rating, counted by the server
+        expected = defaultdict(lambda: {'count': 0, 'total': 0, 'histogram': {}})
+        for row in Review._get_collection().aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': {'expert': '$expert', 'service_type': '$service_type', 'rating': '$rating'},
+                'count': {'$sum': 1},
+            }},
+        ]):
+            key = row['_id']
+            aggregate = expected[(key['expert'], key['service_type'])]
+            aggregate['count'] += row['count']
+            aggregate['total'] += key['rating'] * row['count']
+            aggregate['histogram'][str(key['rating'])] = row['count']
+
+        stored = {
+            (doc['expert'], doc['service_type']): {
+                'count': doc.get('count', 0),
+                'total': doc.get('total', 0),
+                'histogram': {rating: n for rating, n in (doc.get('histogram') or {}).items() if n},
+            }
+            for doc in RatingAggregate._get_collection().find(match)
+        }
+        drifted = [key for key in set(expected) | set(stored) if expected.get(key) != stored.get(key)]
+        for expert_id, service_type in drifted:
+            self.stdout.write(f'Aggregate of expert {expert_id} for {service_type} drifted')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(drifted)} of {len(expected)} rating aggregates drifted'))
+            return
+
+        # Rewritten key by key, so a review counted in meanwhile meets an existing document
+        # instead of a gap; its increment is overwritten at worst and restored by the next run
+        operations = [
+            ReplaceOne(
+                {'expert': expert_id, 'service_type': service_type},
+                dict(values, expert=expert_id, service_type=service_type),
+                upsert=True
+            )
+            for (expert_id, service_type), values in expected.items()
+        ]
+        # Aggregates without reviews go, unless a review was counted into them since they were read
+        operations += [
+            DeleteOne({'expert': expert_id, 'service_type': service_type, 'count': stored[(expert_id, service_type)]['count']})
+            for expert_id, service_type in set(stored) - set(expected)
+        ]
+        if operations:
+            RatingAggregate._get_collection().bulk_write(operations, ordered=False)
+
+        # Ratings are set outright here; reviews created meanwhile are caught by the next run
+        per_expert = defaultdict(lambda: [0, 0])
+        for (expert_id, _), values in expected.items():
+            per_expert[expert_id][0] += values['count']
+            per_expert[expert_id][1] += values['total']
+        profiles = ExpertProfile._get_collection()
+        for profile in profiles.find({'user': match['expert']} if match else {}, {'user': 1}):
+            count, total = per_expert.get(profile['user'], (0, 0))
+            profiles.update_one({'_id': profile['_id']}, {'$set': {
+                'rating': round(total / count, 1) if count else 0.0,
+                'rating_count': count,
+                'updated_at': datetime.datetime.now(),
+            }})
+
+        invalidate_directory()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(expected)} rating aggregates, {len(drifted)} had drifted'
+        ))
@@ -1,4 +1,4 @@
-from mongoengine import Document, StringField, ListField, DateTimeField, ReferenceField, CASCADE, IntField
+from mongoengine import Document, StringField, ListField, DateTimeField, ReferenceField, CASCADE, IntField, MapField
 
 class Review(Document):
     """Review for a service provider (teacher or technician)"""
@@ -17,6 +17,26 @@ class Review(Document):
             'expert',
             'service_type',
             'service_id',
-            ('expert', 'service_type')  # Compound index for querying reviews by expert and service type
+            ('expert', 'service_type'),  # Compound index for querying reviews by expert and service type
+            # Newest-first pages: (created_at, _id) is the keyset of review listings
+            ('-created_at', '-id'),
+            ('user', '-created_at', '-id'),
+            ('expert', '-created_at', '-id'),
+            ('expert', 'service_type', '-created_at', '-id')
+        ]
+    }
+
+class RatingAggregate(Document):
+    """Running totals of an expert's reviews for one service type, kept up to date by reviews.ratings"""
+    expert = ReferenceField('users.MongoUser', reverse_delete_rule=CASCADE, required=True)
+    service_type = StringField(required=True, choices=['repair', 'academic'])
+    count = IntField(default=0)  # Number of reviews
+    total = IntField(default=0)  # Sum of their ratings
+    histogram = MapField(IntField())  # Reviews per rating, keyed "1" to "5"
+    
+    meta = {
+        'collection': 'rating_aggregates',
+        'indexes': [
+            {'fields': ['expert', 'service_type'], 'unique': True}
         ]
     }
\ No newline at end of file
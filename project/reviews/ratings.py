@@ -0,0 +1,67 @@
+"""
+Rating aggregates.
+
+Each review is counted into the RatingAggregate of its expert and service
+type with one $inc (count, rating total and histogram bucket). The expert's
+profile rating is derived from those aggregates, so creating a review or
+asking for an expert's rating summary never reads the reviews themselves.
+The rebuild_rating_aggregates command reconciles the aggregates with the
+reviews.
+"""
+
+import datetime
+
+from users.directory import invalidate_directory
+from users.leaderboard import record_rating
+from users.models import ExpertProfile
+
+from .models import RatingAggregate
+
+RATINGS = ('1', '2', '3', '4', '5')
+# The kind of expert reviewed for each service type
+EXPERT_TYPES = {'academic': 'teacher', 'repair': 'technician'}
+
+
+def summarize(aggregates):
+    """Combine aggregates into {'count', 'average', 'histogram'}"""
+    count = sum(aggregate.count for aggregate in aggregates)
+    total = sum(aggregate.total for aggregate in aggregates)
+    histogram = {rating: sum(aggregate.histogram.get(rating, 0) for aggregate in aggregates) for rating in RATINGS}
+    return {
+        'count': count,
+        'average': round(total / count, 1) if count else 0.0,
+        'histogram': histogram
+    }
+
+
+def set_expert_rating(expert_id, summary):
+    """Store a summary's average and count on the expert's profile unless a newer one is there already"""
+    # Summaries only grow, so the one with the most reviews is the newest
+    ExpertProfile.objects(user=expert_id, rating_count__not__gte=summary['count']).update_one(
+        set__rating=summary['average'],
+        set__rating_count=summary['count'],
+        set__updated_at=datetime.datetime.now()
+    )
+
+
+def record_review(review):
+    """Count a newly created review into its aggregate and refresh the expert's rating"""
+    expert_id = review.expert.id
+    RatingAggregate.objects(expert=expert_id, service_type=review.service_type).update_one(
+        upsert=True,
+        inc__count=1,
+        inc__total=review.rating,
+        **{f'inc__histogram__{review.rating}': 1}
+    )
+    summary = summarize(RatingAggregate.objects(expert=expert_id))
+    set_expert_rating(expert_id, summary)
+    record_rating(expert_id, summary)
+    invalidate_directory(EXPERT_TYPES[review.service_type])
+
+
+def rating_summary(expert_id, service_type=None):
+    """Return the rating summary of an expert, overall or for one service type"""
+    filters = {'expert': expert_id}
+    if service_type:
+        filters['service_type'] = service_type
+    return summarize(list(RatingAggregate.objects(**filters)))
@@ -2,10 +2,10 @@ from rest_framework import serializers
 import datetime
 
 class ReviewSerializer(serializers.Serializer):
-    id = serializers.CharField(source='_id', read_only=True)
-    user_id = serializers.CharField(read_only=True)
+    id = serializers.CharField(source='pk', read_only=True)
+    user_id = serializers.CharField(source='user.id', read_only=True)
     user_name = serializers.SerializerMethodField(read_only=True)
-    expert_id = serializers.CharField()
+    expert_id = serializers.CharField(write_only=True)
     expert_name = serializers.SerializerMethodField(read_only=True)
     service_type = serializers.ChoiceField(choices=['repair', 'academic'])
     service_id = serializers.CharField()
@@ -13,11 +13,23 @@ class ReviewSerializer(serializers.Serializer):
     comment = serializers.CharField()
     created_at = serializers.DateTimeField(read_only=True)
     
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        data['expert_id'] = str(obj.expert.id)
+        return data
+    
     def get_user_name(self, obj):
-        return f"{obj.user.first_name} {obj.user.last_name}"
+        return self.full_name(obj.user)
     
     def get_expert_name(self, obj):
-        return f"{obj.expert.first_name} {obj.expert.last_name}"
+        return self.full_name(obj.expert)
+    
+    def full_name(self, user):
+        # Review listings load a page's users in one query and pass them as context['users'], keyed by id
+        users = self.context.get('users')
+        if users is not None:
+            user = users.get(user.id)
+        return f"{user.first_name} {user.last_name}" if user else ""
     
     def validate(self, data):
         from users.models import MongoUser
@@ -56,10 +68,10 @@ class ReviewSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         from reviews.models import Review
+        from users.cache import get_mongo_user
         from users.models import MongoUser
         
-        user_id = self.context['request'].user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(self.context['request'])
         
         expert = MongoUser.objects(id=validated_data['expert_id']).first()
         
@@ -85,14 +97,8 @@ class ReviewSerializer(serializers.Serializer):
         
         review.save()
         
-        # Update expert's average rating
-        from users.models import ExpertProfile
-        expert_profile = ExpertProfile.objects(user=expert).first()
-        if expert_profile:
-            # Get all reviews for this expert
-            all_reviews = Review.objects(expert=expert)
-            avg_rating = sum(r.rating for r in all_reviews) / len(all_reviews)
-            expert_profile.rating = str(round(avg_rating, 1))
-            expert_profile.save()
+        # Count the review into the expert's rating aggregates and average rating
+        from reviews.ratings import record_review
+        record_review(review)
         
         return review
\ No newline at end of file
@@ -3,7 +3,8 @@ from .views import ReviewViewSet
 
 urlpatterns = [
     path('', ReviewViewSet.as_view({'get': 'list', 'post': 'create'}), name='review-list'),
-    path('<str:pk>/', ReviewViewSet.as_view({'get': 'retrieve'}), name='review-detail'),
+    path('rating-summary/', ReviewViewSet.as_view({'get': 'rating_summary'}), name='rating-summary'),
     path('my-reviews/', ReviewViewSet.as_view({'get': 'my_reviews'}), name='my-reviews'),
     path('expert-reviews/', ReviewViewSet.as_view({'get': 'expert_reviews'}), name='expert-reviews'),
+    path('<str:pk>/', ReviewViewSet.as_view({'get': 'retrieve'}), name='review-detail'),
 ]
\ No newline at end of file
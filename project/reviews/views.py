@@ -1,13 +1,70 @@
+import datetime
+
+from bson import ObjectId
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.utils import timezone
+from mongoengine.errors import ValidationError
 from mongoengine.queryset.visitor import Q
 
 from .models import Review
+from .ratings import rating_summary
 from .serializers import ReviewSerializer
+from users.cache import get_mongo_user
 from users.models import MongoUser
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def review_cursor(review):
+    """Cursor of the page that continues after ``review``"""
+    return f"{review.created_at.isoformat()}_{review.id}"
+
+
+def get_reviews(filters, before=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return (reviews, users, has_more): up to ``limit`` reviews matching
+    ``filters``, newest first and after the ``before`` cursor, with the users
+    they reference keyed by id. Raises ValueError for a bad cursor or limit.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    reviews = Review.objects(**filters)
+    if before:
+        # Keyset on (created_at, _id): reviews created in the same millisecond still page in a stable order
+        created_at, _, review_id = before.rpartition('_')
+        created_at = datetime.datetime.fromisoformat(created_at)
+        if not ObjectId.is_valid(review_id):
+            raise ValueError("Invalid cursor")
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=ObjectId(review_id)))
+    reviews = list(reviews.order_by('-created_at', '-id').no_dereference().limit(limit + 1))
+    
+    # Reviewers and experts of the whole page in one query
+    user_ids = {review.user.id for review in reviews[:limit]} | {review.expert.id for review in reviews[:limit]}
+    users = {user.id: user for user in MongoUser.objects(id__in=list(user_ids)).only('first_name', 'last_name')}
+    return reviews[:limit], users, len(reviews) > limit
+
+
+def review_page(request, filters):
+    """Response with one page of reviews; ?before=<cursor>&limit="""
+    try:
+        reviews, users, has_more = get_reviews(
+            filters,
+            before=request.query_params.get('before'),
+            limit=request.query_params.get('limit', DEFAULT_PAGE_SIZE)
+        )
+    except ValueError:
+        return Response({"detail": "Invalid cursor or limit"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'results': ReviewSerializer(reviews, many=True, context={'users': users}).data,
+        'has_more': has_more,
+        # Cursor for the next page
+        'before': review_cursor(reviews[-1]) if has_more else None
+    })
+
+
 class ReviewViewSet(viewsets.ViewSet):
     def list(self, request):
         # Get query parameters
@@ -17,21 +74,14 @@ class ReviewViewSet(viewsets.ViewSet):
         # Build query
         query = {}
         if expert_id:
-            expert = MongoUser.objects(id=expert_id).first()
+            expert = MongoUser.objects(id=expert_id).only('id').first()
             if not expert:
                 return Response({"detail": f"Expert with ID {expert_id} not found"}, status=status.HTTP_404_NOT_FOUND)
-            query['expert'] = expert
+            query['expert'] = expert.id
         if service_type:
             query['service_type'] = service_type
         
-        reviews = Review.objects(**query).order_by('-created_at')
-        
-        serialized_data = []
-        for review in reviews:
-            serializer = ReviewSerializer(review)
-            serialized_data.append(serializer.data)
-        
-        return Response(serialized_data)
+        return review_page(request, query)
     
     def create(self, request):
         serializer = ReviewSerializer(data=request.data, context={'request': request})
@@ -52,35 +102,40 @@ class ReviewViewSet(viewsets.ViewSet):
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
-    def my_reviews(self, request):
-        user_id = request.user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+    def rating_summary(self, request):
+        # Served from the rating aggregates: ?expert_id=&service_type=
+        expert_id = request.query_params.get('expert_id')
+        service_type = request.query_params.get('service_type')
+        if not expert_id:
+            return Response({"detail": "expert_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if service_type and service_type not in ['repair', 'academic']:
+            return Response({"detail": "service_type must be repair or academic"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get all reviews by this user
-        reviews = Review.objects(user=mongo_user).order_by('-created_at')
+        try:
+            expert = MongoUser.objects(id=expert_id).only('id').first()
+        except ValidationError:
+            expert = None
+        if not expert:
+            return Response({"detail": f"Expert with ID {expert_id} not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        serialized_data = []
-        for review in reviews:
-            serializer = ReviewSerializer(review)
-            serialized_data.append(serializer.data)
+        summary = rating_summary(expert.id, service_type)
+        summary['expert_id'] = str(expert.id)
+        return Response(summary)
+    
+    @action(detail=False, methods=['get'])
+    def my_reviews(self, request):
+        mongo_user = get_mongo_user(request)
         
-        return Response(serialized_data)
+        # Reviews by this user
+        return review_page(request, {'user': mongo_user.id})
     
     @action(detail=False, methods=['get'])
     def expert_reviews(self, request):
-        user_id = request.user.id
-        mongo_user = MongoUser.objects(user_id=str(user_id)).first()
+        mongo_user = get_mongo_user(request)
         
         # Only applicable for teachers and technicians
         if request.user.user_type not in ['teacher', 'technician']:
             return Response({"detail": "Only experts can view their reviews"}, status=status.HTTP_403_FORBIDDEN)
         
-        # Get all reviews for this expert
-        reviews = Review.objects(expert=mongo_user).order_by('-created_at')
-        
-        serialized_data = []
-        for review in reviews:
-            serializer = ReviewSerializer(review)
-            serialized_data.append(serializer.data)
-        
-        return Response(serialized_data)
\ No newline at end of file
+        # Reviews for this expert
+        return review_page(request, {'expert': mongo_user.id})
\ No newline at end of file
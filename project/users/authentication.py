@@ -0,0 +1,26 @@
+"""
+Stateless JWT authentication for the REST API.
+
+ClaimsJWTAuthentication turns a token issued by UserRefreshToken into a
+TokenUser whose attributes (id, user_type, mongo_user_id, first_name,
+last_name) are read from the claims, so authenticating costs no database
+query. Views that need the full User model, such as profile updates, use
+simplejwt's JWTAuthentication instead, which loads it as before.
+
+A stateless user stays authenticated until its access token expires, even
+if the account is deactivated meanwhile.
+"""
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+# Claim that marks a token as carrying the user claims
+CLAIMS_MARKER = 'mongo_user_id'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        # Tokens issued before the claims were added still load the user from the database
+        if CLAIMS_MARKER not in validated_token:
+            return super().get_user(validated_token)
+        return api_settings.TOKEN_USER_CLASS(validated_token)
@@ -0,0 +1,107 @@
+"""
+Small in-process caches for user lookups.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store ``value``; ``ttl`` can only shorten the cache-wide lifetime"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Django user id, or 'pk:' + MongoUser id for lookups by token claim -> raw MongoUser document
+mongo_users = LRUCache(
+    maxsize=getattr(settings, 'MONGO_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'MONGO_USER_CACHE_TTL', 60)
+)
+
+
+def _cached_mongo_user(key, **filters):
+    from .models import MongoUser
+
+    son = mongo_users.get(key)
+    if son is None:
+        mongo_user = MongoUser.objects(**filters).first()
+        if mongo_user is None:
+            # Not cached: the mirror document may be created any moment
+            return None
+        son = mongo_user.to_mongo()
+        mongo_users.set(key, son)
+    # A fresh document per caller, so one request changing it never leaks into another
+    return MongoUser._from_son(son)
+
+
+def get_mongo_user_by_id(user_id):
+    """Return the MongoUser mirroring a Django user id, or None"""
+    return _cached_mongo_user(str(user_id), user_id=str(user_id))
+
+
+def get_mongo_user_by_pk(mongo_user_id):
+    """Return the MongoUser with primary key ``mongo_user_id``, or None"""
+    return _cached_mongo_user(f'pk:{mongo_user_id}', id=mongo_user_id)
+
+
+def get_mongo_user(request):
+    """Return the MongoUser of ``request.user``, looked up at most once per request as ``request.mongo_user``"""
+    mongo_user = getattr(request, 'mongo_user', None)
+    if mongo_user is None:
+        # Users authenticated by ClaimsJWTAuthentication carry the MongoUser id in their token
+        token = getattr(request.user, 'token', None)
+        mongo_user_id = token.get('mongo_user_id') if token is not None else None
+        if mongo_user_id:
+            mongo_user = get_mongo_user_by_pk(mongo_user_id)
+        else:
+            mongo_user = get_mongo_user_by_id(request.user.id)
+        request.mongo_user = mongo_user
+    return mongo_user
+
+
+def invalidate_mongo_user(user_id, mongo_user_id=None):
+    """Forget the cached MongoUser of a Django user id after the document changed"""
+    mongo_users.delete(str(user_id))
+    if mongo_user_id is not None:
+        mongo_users.delete(f'pk:{mongo_user_id}')
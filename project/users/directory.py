@@ -0,0 +1,166 @@
+"""
+Expert directory behind the teacher and technician listings.
+
+A directory page is one aggregation over expert_profiles: filtering and
+sorting use the (user_type, metric) and (user_type, areas) indexes, a $facet
+cuts the page and counts the matches, and a $lookup joins the page's users
+for their names. Pages are cached under a per-user-type version number;
+anything that changes a listed value bumps the version, which orphans every
+cached page of that user type at once.
+
+The aggregation reads the stored documents as they are, without the upgrade
+ExpertProfile applies on load: profiles older than
+EXPERT_PROFILE_SCHEMA_VERSION lack user_type and areas and are not listed
+until the migrate_expert_profiles command has upgraded them.
+
+Set CACHE_REDIS_URL so that all workers share the cache and see each
+other's invalidations; with the default per-process cache a worker may
+serve pages up to EXPERT_DIRECTORY_CACHE_TTL seconds old.
+"""
+
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import ExpertProfile, MongoUser, normalize_area
+
+EXPERT_ORDERINGS = ('rating', 'hourly_rate', 'experience_years', 'completed_services')
+DEFAULT_EXPERT_ORDERING = '-rating'
+MAX_DIRECTORY_PAGE_SIZE = 100
+
+
+def _number(params, name, cast):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return cast(value)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+
+def _version_key(user_type):
+    return f'expert-directory:{user_type}:version'
+
+
+def invalidate_directory(user_type=None):
+    """Drop the cached directory pages of ``user_type``, or of all experts"""
+    for key in ([user_type] if user_type else ['teacher', 'technician']):
+        try:
+            cache.incr(_version_key(key))
+        except ValueError:
+            # No page of this user type was cached since the cache started
+            cache.add(_version_key(key), 1, None)
+
+
+def directory_query(params):
+    """Validate the query ``params`` of a listing; return them normalized, or raise ValueError"""
+    ordering = params.get('ordering') or DEFAULT_EXPERT_ORDERING
+    if ordering.lstrip('-') not in EXPERT_ORDERINGS:
+        raise ValueError(f"ordering must be one of {', '.join(EXPERT_ORDERINGS)}, optionally prefixed with '-'")
+    page = _number(params, 'page', int) or 1
+    page_size = _number(params, 'page_size', int) or settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+    if page < 1 or page_size < 1:
+        raise ValueError("page and page_size must be positive")
+    max_hourly_rate = _number(params, 'max_hourly_rate', Decimal)
+    return {
+        'ordering': ordering,
+        'area': normalize_area(params.get('area') or ''),
+        'max_hourly_rate': str(max_hourly_rate) if max_hourly_rate is not None else None,
+        'min_rating': _number(params, 'min_rating', float),
+        'min_experience_years': _number(params, 'min_experience_years', int),
+        'page': page,
+        'page_size': min(page_size, MAX_DIRECTORY_PAGE_SIZE),
+    }
+
+
+def load_directory_page(user_type, query):
+    """Run the directory aggregation for a normalized query; return {'count', 'results'}"""
+    match = {'user_type': user_type}
+    if query['area']:
+        match['areas'] = query['area']
+    if query['max_hourly_rate'] is not None:
+        match['hourly_rate'] = {'$lte': ExpertProfile.hourly_rate.to_mongo(Decimal(query['max_hourly_rate']))}
+    if query['min_rating'] is not None:
+        match['rating'] = {'$gte': query['min_rating']}
+    if query['min_experience_years'] is not None:
+        match['experience_years'] = {'$gte': query['min_experience_years']}
+
+    ordering = query['ordering']
+    page = next(ExpertProfile._get_collection().aggregate([
+        {'$match': match},
+        {'$sort': {ordering.lstrip('-'): -1 if ordering.startswith('-') else 1, '_id': 1}},
+        {'$facet': {
+            'results': [
+                {'$skip': (query['page'] - 1) * query['page_size']},
+                {'$limit': query['page_size']},
+                {'$lookup': {
+                    'from': MongoUser._get_collection_name(),
+                    'localField': 'user',
+                    'foreignField': '_id',
+                    'as': 'user_doc'
+                }},
+                # Kept when the user is gone, so the page agrees with the count
+                {'$unwind': {'path': '$user_doc', 'preserveNullAndEmptyArrays': True}},
+                {'$project': {
+                    'user': 1,
+                    'first_name': '$user_doc.first_name',
+                    'last_name': '$user_doc.last_name',
+                    'expertise_areas': 1,
+                    'experience_years': 1,
+                    'hourly_rate': 1,
+                    'rating': 1,
+                    'completed_services': 1
+                }},
+            ],
+            'count': [{'$count': 'count'}],
+        }},
+    ]))
+
+    return {
+        'count': page['count'][0]['count'] if page['count'] else 0,
+        'results': [
+            {
+                'id': str(row['user']),
+                'name': f"{row.get('first_name', '')} {row.get('last_name', '')}",
+                'expertise_areas': row.get('expertise_areas') or "",
+                'experience_years': row.get('experience_years', 0),
+                'hourly_rate': str(ExpertProfile.hourly_rate.to_python(row.get('hourly_rate', 0))),
+                'rating': row.get('rating', 0.0),
+                'completed_services': row.get('completed_services', 0)
+            }
+            for row in page['results']
+        ]
+    }
+
+
+def directory_page(request, user_type):
+    """
+    Return a page of the directory of ``user_type`` for a listing request:
+    {'count', 'next', 'previous', 'results'}. Raises ValueError for invalid
+    query parameters.
+    """
+    query = directory_query(request.query_params)
+    version = cache.get(_version_key(user_type), 0)
+    digest = hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    key = f'expert-directory:{user_type}:{version}:{digest}'
+    data = cache.get(key)
+    if data is None:
+        data = load_directory_page(user_type, query)
+        cache.set(key, data, getattr(settings, 'EXPERT_DIRECTORY_CACHE_TTL', 60))
+
+    url = request.build_absolute_uri()
+    has_next = query['page'] * query['page_size'] < data['count']
+    previous = None
+    if query['page'] > 1:
+        previous = remove_query_param(url, 'page') if query['page'] == 2 else replace_query_param(url, 'page', query['page'] - 1)
+    return {
+        'count': data['count'],
+        'next': replace_query_param(url, 'page', query['page'] + 1) if has_next else None,
+        'previous': previous,
+        'results': data['results']
+    }
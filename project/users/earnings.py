@@ -0,0 +1,111 @@
+"""
+Earnings bookkeeping.
+
+Every EarningRecord is counted into EarningRollup rows for its day, week and
+month, so charts and range totals read a handful of rollups instead of
+scanning the expert's earnings. Create records with create_earning so the
+rollups stay in step; the rebuild_earning_rollups command recomputes them
+from scratch.
+"""
+
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from bson import Decimal128
+from pymongo import UpdateOne
+from rest_framework.exceptions import ValidationError
+
+from .models import EarningRecord, EarningRollup
+
+PERIODS = ('day', 'week', 'month')
+
+
+def as_decimal(value):
+    """Return a $sum result as a Decimal; it is an int when nothing was summed or only strings were"""
+    return value.to_decimal() if isinstance(value, Decimal128) else Decimal(value)
+
+
+def parse_amount(value):
+    """Return an amount such as a price quote as a finite Decimal, or raise ValidationError"""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        amount = None
+    # "$50" or "NaN" would be stored as Decimal128('NaN') and poison every $sum of the expert
+    if amount is None or not amount.is_finite():
+        raise ValidationError(f"{value!r} is not a valid amount")
+    return amount
+
+
+def period_start(moment, period):
+    """Return the start of the day, week (Monday) or month ``moment`` falls in"""
+    day = datetime.datetime.combine(moment.date(), datetime.time.min)
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def rollup_operations(record):
+    """Return the upserts adding ``record`` to its rollups"""
+    doc = record.to_mongo()
+    amount = Decimal128(str(record.amount))
+    inc = {'total': amount, 'count': 1}
+    if record.is_paid:
+        inc['paid'] = amount
+
+    return [
+        UpdateOne(
+            {
+                'expert': doc['expert'],
+                'period': period,
+                'period_start': period_start(record.date, period),
+                'service_type': record.service_type,
+            },
+            {'$inc': inc},
+            upsert=True
+        )
+        for period in PERIODS
+    ]
+
+
+def create_earning(expert, amount, service_type, service_id, is_paid=False, date=None):
+    """Save a new EarningRecord and count it into its rollups; raises ValidationError for an invalid amount"""
+    record = EarningRecord(
+        expert=expert,
+        amount=parse_amount(amount),
+        service_type=service_type,
+        service_id=service_id,
+        date=date or datetime.datetime.now(),
+        is_paid=is_paid
+    )
+    record.save()
+    EarningRollup._get_collection().bulk_write(rollup_operations(record), ordered=False)
+    return record
+
+
+def get_rollups(expert_id, period, start, end, service_type=None):
+    """Return the ``period`` rollups of an expert whose periods start in [start, end), oldest first"""
+    filters = {'expert': expert_id, 'period': period, 'period_start__gte': start, 'period_start__lt': end}
+    if service_type:
+        filters['service_type'] = service_type
+    return EarningRollup.objects(**filters).order_by('period_start')
+
+
+def range_rollups(expert_id, start, end, service_type=None):
+    """
+    Return rollups that together cover exactly the days [start, end): month
+    rows for the whole months inside the range and day rows for the rest.
+    """
+    first_month = period_start(start, 'month')
+    if first_month < start:
+        first_month = (first_month + datetime.timedelta(days=32)).replace(day=1)
+    last_month = period_start(end, 'month')
+    if first_month >= last_month:
+        return list(get_rollups(expert_id, 'day', start, end, service_type))
+    return (
+        list(get_rollups(expert_id, 'day', start, first_month, service_type))
+        + list(get_rollups(expert_id, 'month', first_month, last_month, service_type))
+        + list(get_rollups(expert_id, 'day', last_month, end, service_type))
+    )
@@ -0,0 +1,22 @@
+"""
+Expert profile metrics.
+
+The metrics are only ever changed by single update statements (here and in
+reviews.ratings), never by loading and saving a profile, so concurrent
+completions and reviews cannot overwrite each other.
+"""
+
+from .directory import invalidate_directory
+from .leaderboard import record_completion
+from .models import ExpertProfile, EXPERT_PROFILE_SCHEMA_VERSION
+
+
+def record_completed_service(expert):
+    """Count one completed service for ``expert`` (a MongoUser) with a single $inc"""
+    if not ExpertProfile.objects(user=expert, schema_version=EXPERT_PROFILE_SCHEMA_VERSION).update_one(inc__completed_services=1):
+        # $inc fails on the string counter of a profile not upgraded yet; reading it upgrades it
+        if not ExpertProfile.objects(user=expert).only('id').first():
+            return
+        ExpertProfile.objects(user=expert).update_one(inc__completed_services=1)
+    record_completion(expert.id)
+    invalidate_directory(expert.user_type)
@@ -0,0 +1,88 @@
+"""
+Expert leaderboards per service type and expertise area.
+
+Every expert has one LeaderboardEntry on the board of their service type as
+a whole (area '') and one per expertise area on their profile. Entries rank
+by a Bayesian-weighted rating, which pulls the average of experts with few
+reviews towards LEADERBOARD_PRIOR_RATING, then by completed services. The
+(service_type, area, -score, -completed_services) index makes a top-K query
+read exactly K index entries.
+
+Reviews and completions update an expert's entries with a single statement;
+entries are created or re-created when the profile's areas or the expert's
+name change, which also invalidates the cached expert directory. The rebuild_leaderboard command recomputes every board.
+"""
+
+from django.conf import settings
+
+from .directory import invalidate_directory
+from .models import ExpertProfile, LeaderboardEntry, MongoUser, normalize_area, parse_expertise_areas
+
+SERVICE_TYPES = {'teacher': 'academic', 'technician': 'repair'}
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+
+
+def bayesian_rating(rating, rating_count):
+    """Average rating shrunk towards the prior, as if the prior weight of prior-rated reviews were added"""
+    prior = getattr(settings, 'LEADERBOARD_PRIOR_RATING', 3.5)
+    weight = getattr(settings, 'LEADERBOARD_PRIOR_WEIGHT', 10)
+    return (prior * weight + rating * rating_count) / (weight + rating_count)
+
+
+def leaderboard_entries(user, profile):
+    """Return the raw entry documents of an expert, one per board they appear on"""
+    service_type = SERVICE_TYPES.get(user.get('user_type'))
+    if service_type is None:
+        return []
+    rating = profile.get('rating') or 0.0
+    rating_count = profile.get('rating_count') or 0
+    values = {
+        'service_type': service_type,
+        'expert': user['_id'],
+        'name': f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
+        'score': bayesian_rating(rating, rating_count),
+        'rating': rating,
+        'rating_count': rating_count,
+        'completed_services': profile.get('completed_services') or 0,
+    }
+    return [dict(values, area=area) for area in [''] + parse_expertise_areas(profile.get('expertise_areas'))]
+
+
+def sync_expert(expert_id):
+    """Re-create the entries of an expert from their profile, after their areas or name changed"""
+    user = MongoUser._get_collection().find_one(
+        {'_id': expert_id}, {'user_type': 1, 'first_name': 1, 'last_name': 1}
+    )
+    # Loaded through the document so a profile still on the old schema is upgraded first
+    profile = ExpertProfile.objects(user=expert_id).first()
+    entries = leaderboard_entries(user, profile.to_mongo()) if user and profile else []
+
+    collection = LeaderboardEntry._get_collection()
+    collection.delete_many({'expert': expert_id, 'area': {'$nin': [entry['area'] for entry in entries]}})
+    for entry in entries:
+        key = {'service_type': entry['service_type'], 'area': entry['area'], 'expert': expert_id}
+        collection.update_one(key, {'$set': entry}, upsert=True)
+    # The directory lists the same areas and names
+    invalidate_directory(user.get('user_type') if user else None)
+
+
+def record_rating(expert_id, summary):
+    """Move an expert's entries to a new rating summary unless one with more reviews is there already"""
+    LeaderboardEntry.objects(expert=expert_id, rating_count__not__gte=summary['count']).update(
+        set__score=bayesian_rating(summary['average'], summary['count']),
+        set__rating=summary['average'],
+        set__rating_count=summary['count']
+    )
+
+
+def record_completion(expert_id):
+    LeaderboardEntry.objects(expert=expert_id).update(inc__completed_services=1)
+
+
+def top_experts(service_type, area='', limit=DEFAULT_LEADERBOARD_SIZE):
+    """Return the best ``limit`` entries of a board, best first"""
+    limit = max(1, min(int(limit), MAX_LEADERBOARD_SIZE))
+    return list(LeaderboardEntry.objects(service_type=service_type, area=normalize_area(area)).order_by(
+        '-score', '-completed_services'
+    ).no_dereference().limit(limit))
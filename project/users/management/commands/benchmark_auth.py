@@ -0,0 +1,75 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.authentication import ClaimsJWTAuthentication
+from users.cache import get_mongo_user, invalidate_mongo_user
+from users.models import User, MongoUser
+from users.tokens import UserRefreshToken
+
+
+def resolve_by_query(request):
+    # MongoUser resolution as views did it before the user cache
+    return MongoUser.objects(user_id=str(request.user.id)).first()
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request authentication overhead with database-loaded users versus token-claim users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests authenticated per strategy')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            email=f'bench-auth-{tag}@example.com',
+            password=uuid.uuid4().hex,
+            first_name='Bench',
+            last_name='Auth',
+            user_type='student'
+        )
+        mongo_user = MongoUser(
+            user_id=str(user.id),
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            user_type=user.user_type
+        ).save()
+
+        try:
+            plain_token = str(RefreshToken.for_user(user).access_token)
+            claims_token = str(UserRefreshToken.for_user(user, mongo_user=mongo_user).access_token)
+            strategies = [
+                ('JWTAuthentication', JWTAuthentication(), plain_token, None),
+                ('ClaimsJWTAuthentication', ClaimsJWTAuthentication(), claims_token, None),
+                ('JWT + MongoUser query', JWTAuthentication(), plain_token, resolve_by_query),
+                ('claims + cached MongoUser', ClaimsJWTAuthentication(), claims_token, get_mongo_user),
+            ]
+
+            self.stdout.write(f"{'strategy':<28} {'per request':>12} {'SQL queries':>12}")
+            for name, authenticator, token, resolve in strategies:
+                elapsed, queries = self.measure(authenticator, token, resolve, options['requests'])
+                per_request_us = elapsed / options['requests'] * 1e6
+                self.stdout.write(f'{name:<28} {per_request_us:>9.1f} us {queries / options["requests"]:>12.2f}')
+        finally:
+            invalidate_mongo_user(user.id, mongo_user.id)
+            mongo_user.delete()
+            user.delete()
+
+    def measure(self, authenticator, token, resolve, requests):
+        factory = RequestFactory()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                request = factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                request.user, _ = authenticator.authenticate(request)
+                if resolve is not None:
+                    resolve(request)
+            elapsed = time.perf_counter() - start
+        return elapsed, len(queries)
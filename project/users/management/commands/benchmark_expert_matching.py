@@ -0,0 +1,64 @@
+import random
+import time
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from users.matching import ExpertCandidate, ExpertIndex
+from users.models import MongoUser, ExpertProfile
+
+SUBJECTS = [
+    'Math', 'Physics', 'Chemistry', 'Biology', 'Computer Science', 'English Literature', 'History',
+    'Economics', 'Statistics', 'Calculus', 'Linear Algebra', 'Organic Chemistry', 'Geography',
+]
+DEVICES = [
+    'Smartphones', 'Laptops', 'Tablets', 'Desktop Computers', 'Game Consoles', 'Printers',
+    'Smart Watches', 'Cameras', 'Headphones', 'Televisions', 'Routers',
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure how long matching one question or repair request to experts takes with a large in-memory index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--experts', type=int, default=20000, help='Synthetic experts in the index')
+        parser.add_argument('--items', type=int, default=10000, help='Items matched')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        candidates = []
+        for i in range(options['experts']):
+            user_type, vocabulary = ('teacher', SUBJECTS) if i % 2 else ('technician', DEVICES)
+            start = rng.randrange(0, 20)
+            profile = ExpertProfile(
+                user=MongoUser(id=ObjectId()),
+                user_type=user_type,
+                expertise_areas=', '.join(rng.sample(vocabulary, 3)),
+                rating=rng.uniform(1, 5),
+                rating_count=rng.randrange(0, 200),
+                availability_hours=f'{start}-{start + rng.randrange(4, 10)}'
+            )
+            profile.clean()
+            candidates.append(ExpertCandidate(profile))
+        workload = {candidate.expert_id: rng.randrange(0, 6) for candidate in candidates}
+
+        index = ExpertIndex()
+        started = time.perf_counter()
+        index.load(candidates, workload)
+        built = time.perf_counter() - started
+
+        items = [
+            ('teacher', rng.choice(SUBJECTS + ['AP Physics', 'math homework'])) if i % 2
+            else ('technician', rng.choice(['Laptop', 'iPhone smartphone', 'broken tablet screen'] + DEVICES))
+            for i in range(options['items'])
+        ]
+        started = time.perf_counter()
+        for user_type, text in items:
+            index.match(user_type, text)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Index of {options['experts']} experts built in {built * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"Matched {options['items']} items in {elapsed * 1000:.1f} ms: "
+            f"{elapsed / options['items'] * 1e6:.1f} us per item"
+        ))
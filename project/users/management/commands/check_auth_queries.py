@@ -0,0 +1,88 @@
+import uuid
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from users.authentication import ClaimsJWTAuthentication
+from users.cache import get_mongo_user, invalidate_mongo_user
+from users.models import User, MongoUser
+from users.tokens import UserRefreshToken
+
+
+@contextmanager
+def record_mongo_user_queries():
+    """Record the filter of every find sent to the MongoUser collection"""
+    filters = []
+    Collection = type(MongoUser._get_collection())
+    original = Collection.find
+    users_collection = MongoUser._get_collection_name()
+
+    def find(collection, *args, **kwargs):
+        if collection.name == users_collection:
+            filters.append(args[0] if args else kwargs.get('filter'))
+        return original(collection, *args, **kwargs)
+
+    with mock.patch.object(Collection, 'find', find):
+        yield filters
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that requests authenticated by token claims resolve their MongoUser by primary key, '
+        'with no SQL query and at most one MongoDB query in all'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='Requests authenticated with one token')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            email=f'check-auth-{tag}@example.com',
+            password=uuid.uuid4().hex,
+            first_name='Check',
+            last_name='Auth',
+            user_type='student'
+        )
+        mongo_user = MongoUser(
+            user_id=str(user.id),
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            user_type=user.user_type
+        ).save()
+
+        try:
+            token = str(UserRefreshToken.for_user(user, mongo_user=mongo_user).access_token)
+            invalidate_mongo_user(user.id, mongo_user.id)
+            authenticator = ClaimsJWTAuthentication()
+            factory = RequestFactory()
+            resolved = set()
+            with CaptureQueriesContext(connection) as sql, record_mongo_user_queries() as filters:
+                for _ in range(options['requests']):
+                    request = factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                    request.user, _ = authenticator.authenticate(request)
+                    resolved.add(get_mongo_user(request).id)
+        finally:
+            invalidate_mongo_user(user.id, mongo_user.id)
+            mongo_user.delete()
+            user.delete()
+
+        failures = []
+        if resolved != {mongo_user.id}:
+            failures.append(f'resolved {resolved} instead of {mongo_user.id}')
+        if len(sql):
+            failures.append(f'made {len(sql)} SQL queries')
+        if len(filters) > 1:
+            failures.append(f'made {len(filters)} MongoUser queries, not one cache fill')
+        if any('user_id' in (query or {}) for query in filters):
+            failures.append('looked the MongoUser up by user_id instead of by its id claim')
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["requests"]} requests resolved their MongoUser with {len(filters)} query by primary key'
+        ))
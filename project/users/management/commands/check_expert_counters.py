@@ -0,0 +1,54 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.experts import record_completed_service
+from users.models import MongoUser, ExpertProfile
+
+
+def increment_by_save(expert):
+    # Read-parse-increment-save, as completions updated the counter before it was atomic
+    profile = ExpertProfile.objects(user=expert).first()
+    profile.completed_services += 1
+    profile.save()
+
+
+class Command(BaseCommand):
+    help = (
+        'Run parallel service completions against a throwaway expert profile and check that '
+        'no increment of completed_services is lost'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completions', type=int, default=100, help='Completions to run in parallel')
+        parser.add_argument('--threads', type=int, default=32, help='Worker threads')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        expert = MongoUser(
+            user_id=f'check-counters-{tag}',
+            email=f'check-counters-{tag}@example.com',
+            first_name='Check',
+            last_name='Counters',
+            user_type='teacher',
+            is_expert=True
+        ).save()
+        profile = ExpertProfile(user=expert, user_type='teacher', expertise_areas='').save()
+
+        try:
+            results = {}
+            for name, increment in (('read-modify-save', increment_by_save), ('atomic $inc', record_completed_service)):
+                ExpertProfile.objects(id=profile.id).update_one(set__completed_services=0)
+                with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                    list(pool.map(lambda _: increment(expert), range(options['completions'])))
+                results[name] = ExpertProfile.objects(id=profile.id).scalar('completed_services').first()
+                lost = options['completions'] - results[name]
+                self.stdout.write(f'{name:<18} {results[name]:>6} counted {lost:>6} lost')
+        finally:
+            profile.delete()
+            expert.delete()
+
+        if results['atomic $inc'] != options['completions']:
+            raise CommandError('Atomic completions lost updates')
+        self.stdout.write(self.style.SUCCESS(f"No lost updates over {options['completions']} parallel completions"))
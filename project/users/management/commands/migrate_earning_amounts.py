@@ -0,0 +1,50 @@
+from decimal import Decimal, InvalidOperation
+
+from bson import Decimal128
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from users.models import EarningRecord
+
+
+class Command(BaseCommand):
+    help = 'Convert EarningRecord amounts stored as strings to Decimal128'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records converted per bulk write')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be converted without writing')
+
+    def handle(self, *args, **options):
+        earnings = EarningRecord._get_collection()
+        converted = 0
+        invalid = []
+        operations = []
+
+        for record in earnings.find({'amount': {'$type': 'string'}}, {'amount': 1}):
+            try:
+                amount = Decimal(record['amount'].strip())
+                if not amount.is_finite():
+                    raise InvalidOperation
+            except InvalidOperation:
+                invalid.append(record['_id'])
+                continue
+
+            converted += 1
+            if options['dry_run']:
+                continue
+            # Match the string too, so a record changed in the meantime is left alone
+            operations.append(UpdateOne(
+                {'_id': record['_id'], 'amount': record['amount']},
+                {'$set': {'amount': Decimal128(amount)}}
+            ))
+            if len(operations) >= options['batch_size']:
+                earnings.bulk_write(operations, ordered=False)
+                operations = []
+
+        if operations:
+            earnings.bulk_write(operations, ordered=False)
+
+        for record_id in invalid:
+            self.stderr.write(f'Skipped earning {record_id}: amount is not a number')
+        action = 'Would convert' if options['dry_run'] else 'Converted'
+        self.stdout.write(self.style.SUCCESS(f'{action} {converted} earning amounts, skipped {len(invalid)}'))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from users.directory import invalidate_directory
+from users.models import MongoUser, ExpertProfile, EXPERT_PROFILE_SCHEMA_VERSION, expert_profile_upgrade
+
+
+class Command(BaseCommand):
+    help = 'Upgrade expert profiles to the current schema version (numeric metrics, user_type and areas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Profiles upgraded per bulk write')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be upgraded without writing')
+
+    def handle(self, *args, **options):
+        profiles = ExpertProfile._get_collection()
+        outdated = {'$or': [
+            {'schema_version': {'$exists': False}},
+            {'schema_version': {'$lt': EXPERT_PROFILE_SCHEMA_VERSION}}
+        ]}
+
+        upgraded = 0
+        batch = []
+        for profile in profiles.find(outdated):
+            batch.append(profile)
+            if len(batch) >= options['batch_size']:
+                upgraded += self.upgrade(batch, options['dry_run'])
+                batch = []
+        if batch:
+            upgraded += self.upgrade(batch, options['dry_run'])
+
+        if upgraded and not options['dry_run']:
+            invalidate_directory()
+
+        action = 'Would upgrade' if options['dry_run'] else 'Upgraded'
+        self.stdout.write(self.style.SUCCESS(f'{action} {upgraded} expert profiles'))
+
+    def upgrade(self, batch, dry_run):
+        # One lookup for the user types of the whole batch
+        user_types = {
+            user['_id']: user.get('user_type')
+            for user in MongoUser._get_collection().find(
+                {'_id': {'$in': [profile.get('user') for profile in batch]}}, {'user_type': 1}
+            )
+        }
+        operations = []
+        for profile in batch:
+            changes = expert_profile_upgrade(profile, user_types.get(profile.get('user')))
+            # Skip profiles the lazy upgrade on read got to first
+            operations.append(UpdateOne(
+                {'_id': profile['_id'], 'schema_version': profile.get('schema_version', {'$exists': False})},
+                {'$set': changes}
+            ))
+        if dry_run:
+            return len(operations)
+        return ExpertProfile._get_collection().bulk_write(operations, ordered=False).modified_count
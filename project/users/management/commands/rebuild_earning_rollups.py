@@ -0,0 +1,71 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from bson import Decimal128, ObjectId
+from django.core.management.base import BaseCommand
+
+from users.earnings import PERIODS, as_decimal, period_start
+from users.models import EarningRecord, EarningRollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the earnings rollups from the earning records. '
+        'Earnings created while this runs may be missed; run it again afterwards if any were.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expert', default=None, help='Rebuild only the rollups of this MongoUser id')
+
+    def handle(self, *args, **options):
+        match = {}
+        if options['expert']:
+            match['expert'] = ObjectId(options['expert'])
+
+        # One row per expert, service type and day, summed by the server
+        days = EarningRecord._get_collection().aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': {
+                    'expert': '$expert',
+                    'service_type': '$service_type',
+                    'year': {'$year': '$date'},
+                    'month': {'$month': '$date'},
+                    'day': {'$dayOfMonth': '$date'},
+                },
+                'total': {'$sum': '$amount'},
+                'paid': {'$sum': {'$cond': ['$is_paid', '$amount', Decimal128('0')]}},
+                'count': {'$sum': 1},
+            }},
+        ])
+
+        # Weeks and months are folded from the days here
+        rollups = defaultdict(lambda: {'total': Decimal('0'), 'paid': Decimal('0'), 'count': 0})
+        for row in days:
+            key = row['_id']
+            day = datetime.datetime(key['year'], key['month'], key['day'])
+            for period in PERIODS:
+                rollup = rollups[(key['expert'], period, period_start(day, period), key['service_type'])]
+                rollup['total'] += as_decimal(row['total'])
+                rollup['paid'] += as_decimal(row['paid'])
+                rollup['count'] += row['count']
+
+        collection = EarningRollup._get_collection()
+        collection.delete_many(match)
+        documents = [
+            {
+                'expert': expert,
+                'period': period,
+                'period_start': start,
+                'service_type': service_type,
+                'total': Decimal128(sums['total']),
+                'paid': Decimal128(sums['paid']),
+                'count': sums['count'],
+            }
+            for (expert, period, start, service_type), sums in rollups.items()
+        ]
+        if documents:
+            collection.insert_many(documents, ordered=False)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(documents)} earnings rollups'))
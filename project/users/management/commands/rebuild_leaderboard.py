@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.leaderboard import leaderboard_entries
+from users.models import MongoUser, ExpertProfile, LeaderboardEntry, EXPERT_PROFILE_SCHEMA_VERSION
+
+
+class Command(BaseCommand):
+    help = 'Recompute every expert leaderboard from the expert profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Profiles read per batch')
+
+    def handle(self, *args, **options):
+        # Profiles still on the old schema hold their metrics as strings
+        if ExpertProfile._get_collection().find_one({'$or': [
+            {'schema_version': {'$exists': False}},
+            {'schema_version': {'$lt': EXPERT_PROFILE_SCHEMA_VERSION}}
+        ]}, {'_id': 1}):
+            raise CommandError('Some expert profiles are not upgraded; run migrate_expert_profiles first')
+
+        entries = []
+        batch = []
+        for profile in ExpertProfile._get_collection().find(
+            {}, {'user': 1, 'expertise_areas': 1, 'rating': 1, 'rating_count': 1, 'completed_services': 1}
+        ):
+            batch.append(profile)
+            if len(batch) >= options['batch_size']:
+                entries.extend(self.entries_for(batch))
+                batch = []
+        if batch:
+            entries.extend(self.entries_for(batch))
+
+        collection = LeaderboardEntry._get_collection()
+        collection.delete_many({})
+        for start in range(0, len(entries), options['batch_size']):
+            collection.insert_many(entries[start:start + options['batch_size']], ordered=False)
+
+        boards = len({(entry['service_type'], entry['area']) for entry in entries})
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {boards} leaderboards with {len(entries)} entries'))
+
+    def entries_for(self, profiles):
+        # The users of the whole batch in one query
+        users = {
+            user['_id']: user
+            for user in MongoUser._get_collection().find(
+                {'_id': {'$in': [profile.get('user') for profile in profiles]}},
+                {'user_type': 1, 'first_name': 1, 'last_name': 1}
+            )
+        }
+        entries = []
+        for profile in profiles:
+            user = users.get(profile.get('user'))
+            if user:
+                entries.extend(leaderboard_entries(user, profile))
+        return entries
@@ -0,0 +1,257 @@
+"""
+Matching incoming questions and repair requests to experts.
+
+Each worker keeps an in-memory inverted index from expertise terms to the
+teachers or technicians whose profile lists them. A term is a whole
+normalized area ("computer science") or one of its words, singularized
+("laptops" -> "laptop"), so "Laptop" finds an expert of "Laptops, Phones".
+Each term's experts are kept grouped by availability_hours and sorted by
+rank, so matching an item is a few dict lookups and a merge of the heads of
+those lists, with no database access.
+
+Candidates rank by how closely their areas match, then by whether the time
+of day is inside their availability_hours, then by their Bayesian-weighted
+rating less MATCHING_WORKLOAD_WEIGHT per open item they are working on.
+
+The index follows the database by itself. The first match of a worker
+builds it; from then on a background thread re-reads, every
+MATCHING_INDEX_REFRESH seconds, the profiles whose updated_at moved since
+its last look and the open workload of every expert, and re-sorts in
+memory. Every MATCHING_INDEX_MAX_AGE seconds it is rebuilt from scratch so
+deleted profiles drop out. Matching only ever reads the current snapshot,
+so no request waits for a refresh.
+"""
+
+import datetime
+import heapq
+import logging
+import re
+import threading
+import time
+from operator import attrgetter
+
+from django.conf import settings
+
+from .leaderboard import bayesian_rating
+from .models import ExpertProfile, normalize_area
+
+logger = logging.getLogger(__name__)
+
+# Words that say nothing about a subject or device
+STOP_WORDS = {'a', 'an', 'and', 'for', 'in', 'of', 'on', 'the', 'to', 'with'}
+# Profile changes are re-read from a little before the last look, for clock skew between workers
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def _singular(word):
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def match_terms(text):
+    """Return (normalized phrase, set of its words) for an area, subject or device type"""
+    phrase = normalize_area(text or '')
+    words = {_singular(word) for word in re.findall(r'\w+', phrase) if word not in STOP_WORDS}
+    return phrase, words
+
+
+def parse_hours(text):
+    """Return (start, end) hours of an availability like "9-17", or None if it cannot be read"""
+    match = re.fullmatch(r'\s*(\d{1,2})\s*-\s*(\d{1,2})\s*', text or '')
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    if start > 24 or end > 24:
+        return None
+    return start, end
+
+
+def is_available(hours, hour):
+    if hours is None:
+        return True
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end  # Overnight, e.g. "22-6"
+
+
+class ExpertCandidate:
+    __slots__ = ('expert_id', 'user_type', 'phrases', 'words', 'score', 'hours', 'rank')
+
+    def __init__(self, profile):
+        self.expert_id = profile.user.id
+        self.user_type = profile.user_type
+        self.phrases = set()
+        self.words = set()
+        for area in profile.areas or []:
+            phrase, words = match_terms(area)
+            self.phrases.add(phrase)
+            self.words |= words
+        self.score = bayesian_rating(profile.rating or 0.0, profile.rating_count or 0)
+        self.hours = parse_hours(profile.availability_hours)
+        self.rank = self.score  # score less the workload penalty, set on the copies an index holds
+
+    def ranked(self, rank):
+        """Return a copy of this candidate ranked ``rank``, leaving this one as it is"""
+        candidate = object.__new__(ExpertCandidate)
+        for name in self.__slots__:
+            setattr(candidate, name, getattr(self, name))
+        candidate.rank = rank
+        return candidate
+
+
+class ExpertIndex:
+    def __init__(self):
+        self._candidates = {}  # expert_id -> ExpertCandidate
+        # (phrases, words): each (user_type, term) -> {availability hours: candidates, highest rank first}
+        self._terms = ({}, {})
+        self._built_at = None
+        self._synced_at = None
+        self._refresher = None
+
+    def match(self, user_type, text, limit=None, now=None):
+        """Return the ids of the best ``limit`` experts of ``user_type`` for an item about ``text``"""
+        limit = limit or getattr(settings, 'MATCHING_SUGGESTIONS', 5)
+        hour = (now or datetime.datetime.now()).hour
+        phrase, words = match_terms(text)
+        phrase_index, word_index = self._terms
+        word_buckets = [bucket for bucket in (word_index.get((user_type, word)) for word in words) if bucket]
+
+        # Experts listing the whole phrase also list all of its words, so they are the strongest matches
+        seen = set()
+        picked = self._pick(phrase_index.get((user_type, phrase), {}), hour, limit, seen)
+        if len(picked) < limit and len(word_buckets) == 1:
+            picked += self._pick(word_buckets[0], hour, limit - len(picked), seen)
+        elif len(picked) < limit and word_buckets:
+            # Several words hit: the experts sharing the most of them come first
+            strength = {}
+            candidates = {}
+            for bucket in word_buckets:
+                for ranked in bucket.values():
+                    for candidate in ranked:
+                        if candidate.expert_id not in seen:
+                            strength[candidate.expert_id] = strength.get(candidate.expert_id, 0) + 1
+                            candidates[candidate.expert_id] = candidate
+            picked += heapq.nlargest(limit - len(picked), candidates.values(), key=lambda candidate: (
+                strength[candidate.expert_id], is_available(candidate.hours, hour), candidate.rank
+            ))
+        return [candidate.expert_id for candidate in picked]
+
+    def _pick(self, bucket, hour, limit, seen):
+        """Take the ``limit`` best experts of a bucket not in ``seen``: available at ``hour`` first, then by rank"""
+        picked = []
+        if limit <= 0:
+            return picked
+        available = [ranked for hours, ranked in bucket.items() if is_available(hours, hour)]
+        busy = [ranked for hours, ranked in bucket.items() if not is_available(hours, hour)]
+        for group in (available, busy):
+            for candidate in heapq.merge(*group, key=attrgetter('rank'), reverse=True):
+                if candidate.expert_id in seen:
+                    continue
+                seen.add(candidate.expert_id)
+                picked.append(candidate)
+                if len(picked) >= limit:
+                    return picked
+        return picked
+
+    def start_refreshing(self):
+        """Keep the index following the database from a background thread"""
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_forever, name='expert-index-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(getattr(settings, 'MATCHING_INDEX_REFRESH', 30))
+            try:
+                self.refresh()
+            except Exception:
+                # Matches keep reading the last good snapshot; the next round tries again
+                logger.exception('Refreshing the expert index failed')
+
+    def refresh(self):
+        """Apply the changes since the last look, or rebuild the index once it is MATCHING_INDEX_MAX_AGE old"""
+        if self._synced_at is None or time.monotonic() - self._built_at > getattr(settings, 'MATCHING_INDEX_MAX_AGE', 600):
+            self.rebuild()
+        else:
+            self.sync()
+
+    def rebuild(self):
+        """Build the index from every expert profile"""
+        started = datetime.datetime.now()
+        self.load((ExpertCandidate(profile) for profile in self._profiles()), self._load_workload())
+        self._synced_at = started
+
+    def sync(self):
+        """Apply the profiles changed since the last look and reload the workload"""
+        started = datetime.datetime.now()
+        candidates = dict(self._candidates)
+        for profile in self._profiles(updated_at__gte=self._synced_at - SYNC_OVERLAP):
+            candidates[profile.user.id] = ExpertCandidate(profile)
+        self._index(candidates, self._load_workload())
+        self._synced_at = started
+
+    def load(self, candidates, workload):
+        """Replace the whole index with ``candidates`` and the {expert_id: open items} ``workload``"""
+        self._index({candidate.expert_id: candidate for candidate in candidates}, workload)
+        self._built_at = time.monotonic()
+
+    def _index(self, candidates, workload):
+        workload_weight = getattr(settings, 'MATCHING_WORKLOAD_WEIGHT', 0.25)
+        phrases = {}
+        words = {}
+        for candidate in candidates.values():
+            # Ranked copies, as matches may still be reading the current index's candidates
+            candidate = candidate.ranked(candidate.score - workload_weight * workload.get(candidate.expert_id, 0))
+            for phrase in candidate.phrases:
+                phrases.setdefault((candidate.user_type, phrase), {}).setdefault(candidate.hours, []).append(candidate)
+            for word in candidate.words:
+                words.setdefault((candidate.user_type, word), {}).setdefault(candidate.hours, []).append(candidate)
+        for buckets in (phrases, words):
+            for bucket in buckets.values():
+                for ranked in bucket.values():
+                    ranked.sort(key=attrgetter('rank'), reverse=True)
+        # Swapped in whole, so concurrent matches see either the old index or the new one
+        self._candidates, self._terms = candidates, (phrases, words)
+
+    def _profiles(self, **filters):
+        return ExpertProfile.objects(user_type__in=['teacher', 'technician'], **filters).only(
+            'user', 'user_type', 'areas', 'rating', 'rating_count', 'availability_hours'
+        ).no_dereference()
+
+    def _load_workload(self):
+        """Count the items every expert has assigned or in progress"""
+        from academic.models import AcademicQuestion
+        from repair.models import RepairRequest
+
+        workload = {}
+        for model, field in ((AcademicQuestion, 'teacher'), (RepairRequest, 'technician')):
+            for row in model.objects(status__in=['assigned', 'in_progress']).aggregate([
+                {'$match': {field: {'$ne': None}}},
+                {'$group': {'_id': f'${field}', 'open': {'$sum': 1}}},
+            ]):
+                workload[row['_id']] = workload.get(row['_id'], 0) + row['open']
+        return workload
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_expert_index():
+    """Return the worker's index, building it on first use and refreshing it in the background after"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = ExpertIndex()
+                index.rebuild()
+                index.start_refreshing()
+                _index = index
+    return _index
+
+
+def match_experts(user_type, text, limit=None):
+    """Return the ids of the experts of ``user_type`` best suited to an item about ``text``, best first"""
+    return get_expert_index().match(user_type, text, limit)
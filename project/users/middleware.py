@@ -0,0 +1,91 @@
+"""
+JWT authentication for WebSocket connections.
+
+The access token is read from the ``token`` query string parameter or from
+the ``Sec-WebSocket-Protocol`` header, sent as the two subprotocols
+``access_token, <jwt>``; in the latter case ``scope['auth_subprotocol']`` is
+set so the consumer can echo it back when accepting. Verified tokens are
+cached with the user they resolve to, so a reconnect storm after a deploy
+costs one signature check and one user query per distinct token rather than
+per connection.
+"""
+
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CLAIMS_MARKER
+from .cache import LRUCache
+from .models import User
+
+AUTH_SUBPROTOCOL = 'access_token'
+
+verified_tokens = LRUCache(
+    maxsize=getattr(settings, 'WEBSOCKET_AUTH_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'WEBSOCKET_AUTH_CACHE_TTL', 300)
+)
+
+
+def get_raw_token(scope):
+    """Return (token, subprotocol used to send it) from a websocket scope"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0], None
+
+    subprotocols = scope.get('subprotocols') or []
+    if AUTH_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(AUTH_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], AUTH_SUBPROTOCOL
+    return None, None
+
+
+@database_sync_to_async
+def get_user(user_id):
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}, is_active=True).first()
+
+
+async def authenticate(raw_token):
+    """Return the active user a raw access token belongs to, or None"""
+    user = verified_tokens.get(raw_token)
+    if user is not None:
+        return user
+
+    try:
+        token = AccessToken(raw_token)
+    except TokenError:
+        return None
+
+    if CLAIMS_MARKER in token:
+        # Tokens carrying the user claims need no database lookup, as in ClaimsJWTAuthentication
+        user = api_settings.TOKEN_USER_CLASS(token)
+    else:
+        user = await get_user(token[api_settings.USER_ID_CLAIM])
+    if user is not None:
+        # Never keep a token around past its own expiry
+        verified_tokens.set(raw_token, user, ttl=token['exp'] - time.time())
+    return user
+
+
+class JWTAuthMiddleware:
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token, subprotocol = get_raw_token(scope)
+        user = await authenticate(raw_token) if raw_token else None
+        scope['user'] = user or AnonymousUser()
+        if user is not None and subprotocol:
+            scope['auth_subprotocol'] = subprotocol
+        return await self.inner(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
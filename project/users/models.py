@@ -1,6 +1,10 @@
+import datetime
+import decimal
+
+from bson import Decimal128
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from mongoengine import Document, StringField, EmailField, DateTimeField, BooleanField, ReferenceField, CASCADE
+from mongoengine import Document, StringField, EmailField, DateTimeField, BooleanField, ReferenceField, CASCADE, Decimal128Field, IntField, FloatField, ListField, QuerySet
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -74,21 +78,131 @@ class MongoUser(Document):
         'indexes': ['user_id', 'email', 'user_type']
     }
 
+def normalize_area(area):
+    return ' '.join(area.lower().split())
+
+
+def parse_expertise_areas(text):
+    """Return the normalized areas of a comma-separated expertise_areas string"""
+    return sorted({normalize_area(area) for area in (text or '').split(',') if area.strip()})
+
+
+# Version 2 stores the profile metrics as numbers instead of strings, version 3 adds areas
+EXPERT_PROFILE_SCHEMA_VERSION = 3
+EXPERT_PROFILE_CONVERSIONS = {
+    'experience_years': lambda value: int(decimal.Decimal(value)),
+    'completed_services': lambda value: int(decimal.Decimal(value)),
+    'rating': float,
+    'hourly_rate': lambda value: Decimal128(decimal.Decimal(value)),
+}
+
+
+def expert_profile_upgrade(son, user_type=None):
+    """
+    Return the $set that brings a raw expert profile document to the current
+    schema version; values that are not numbers are reset to 0. ``user_type``
+    is that of the profile's user, for profiles that predate the field.
+    """
+    changes = {'schema_version': EXPERT_PROFILE_SCHEMA_VERSION}
+    if user_type in ('teacher', 'technician') and not son.get('user_type'):
+        changes['user_type'] = user_type
+    if 'areas' not in son:
+        changes['areas'] = parse_expertise_areas(son.get('expertise_areas'))
+    for field, convert in EXPERT_PROFILE_CONVERSIONS.items():
+        if isinstance(son.get(field), str):
+            try:
+                changes[field] = convert(son[field].strip() or '0')
+            except (ArithmeticError, ValueError):
+                changes[field] = convert('0')
+    return changes
+
+
+def upgrade_expert_profile(son):
+    """Upgrade a raw expert profile document in place and in the database"""
+    collection = ExpertProfile._get_collection()
+    full = son
+    if not all(field in son for field in list(EXPERT_PROFILE_CONVERSIONS) + ['expertise_areas']):
+        # Loaded with only(); the whole document is needed to upgrade it
+        full = collection.find_one({'_id': son['_id']}) or son
+    user = MongoUser._get_collection().find_one({'_id': full.get('user')}, {'user_type': 1}) or {}
+    changes = expert_profile_upgrade(full, user.get('user_type'))
+    # Matching the old version keeps a concurrent upgrade or newer write from being overwritten
+    collection.update_one(
+        {'_id': son['_id'], 'schema_version': full.get('schema_version', {'$exists': False})},
+        {'$set': changes}
+    )
+    son.update(changes)
+
+
+class ExpertProfileQuerySet(QuerySet):
+    def only(self, *fields):
+        # Without schema_version a partial load would look like a version 1 profile and be upgraded again
+        return super().only(*fields, 'schema_version')
+
+
 class ExpertProfile(Document):
     """
     Profile for teachers and technicians with expertise information
     """
     user = ReferenceField('MongoUser', reverse_delete_rule=CASCADE)
+    user_type = StringField(choices=['teacher', 'technician'])  # Copied from MongoUser so listings filter on one collection
     expertise_areas = StringField(required=True)  # e.g., "Math, Physics" or "Smartphones, Laptops"
-    experience_years = StringField(default="0")
-    hourly_rate = StringField(default="0")
+    areas = ListField(StringField())  # expertise_areas split and normalized, for filtering by area
+    experience_years = IntField(default=0, min_value=0)
+    hourly_rate = Decimal128Field(default=decimal.Decimal('0'), min_value=0)
     availability_hours = StringField(default="9-17")  # e.g., "9-17" for 9 AM to 5 PM
-    completed_services = StringField(default="0")  # Number of completed services
-    rating = StringField(default="0.0")  # Average rating
+    completed_services = IntField(default=0)  # Number of completed services
+    rating = FloatField(default=0.0)  # Average rating
+    rating_count = IntField(default=0)  # Number of reviews the rating averages
+    schema_version = IntField(default=EXPERT_PROFILE_SCHEMA_VERSION)
+    updated_at = DateTimeField()  # Last change to the fields expert matching ranks on
     
     meta = {
         'collection': 'expert_profiles',
-        'indexes': ['user']
+        'queryset_class': ExpertProfileQuerySet,
+        'indexes': [
+            'user',
+            ('user_type', '-rating'),
+            ('user_type', 'hourly_rate'),
+            ('user_type', '-experience_years'),
+            ('user_type', '-completed_services'),
+            ('user_type', 'areas'),
+            'updated_at'
+        ]
+    }
+    
+    def clean(self):
+        self.areas = parse_expertise_areas(self.expertise_areas)
+        self.updated_at = datetime.datetime.now()
+    
+    @classmethod
+    def _from_son(cls, son, *args, **kwargs):
+        # Documents written before the numeric fields are upgraded the first time they are read
+        if son.get('schema_version', 1) < EXPERT_PROFILE_SCHEMA_VERSION and '_id' in son:
+            upgrade_expert_profile(son)
+        return super()._from_son(son, *args, **kwargs)
+
+class LeaderboardEntry(Document):
+    """
+    One expert's place on the leaderboard of a service type and expertise
+    area, maintained by users.leaderboard
+    """
+    service_type = StringField(required=True, choices=['repair', 'academic'])
+    area = StringField(default='')  # Normalized expertise area; '' is the board of the whole service type
+    expert = ReferenceField('MongoUser', reverse_delete_rule=CASCADE, required=True)
+    name = StringField()  # Copied from the expert so a board is read from this collection alone
+    score = FloatField(default=0.0)  # Bayesian-weighted rating
+    rating = FloatField(default=0.0)
+    rating_count = IntField(default=0)
+    completed_services = IntField(default=0)
+    
+    meta = {
+        'collection': 'leaderboard_entries',
+        'indexes': [
+            {'fields': ['service_type', 'area', 'expert'], 'unique': True},
+            ('service_type', 'area', '-score', '-completed_services'),
+            'expert'
+        ]
     }
 
 class EarningRecord(Document):
@@ -96,7 +210,7 @@ class EarningRecord(Document):
     Record of earnings for experts
     """
     expert = ReferenceField('MongoUser', reverse_delete_rule=CASCADE)
-    amount = StringField(required=True)  # Amount earned
+    amount = Decimal128Field(required=True)  # Amount earned; Decimal128 so sums are exact and done in MongoDB
     service_type = StringField(required=True, choices=['repair', 'academic'])  # Type of service
     service_id = StringField(required=True)  # ID of the repair request or academic question
     date = DateTimeField()
@@ -104,5 +218,29 @@ class EarningRecord(Document):
     
     meta = {
         'collection': 'earnings',
-        'indexes': ['expert', 'date']
+        'indexes': [
+            'expert',
+            'date',
+            ('expert', '-date')  # Dashboard: an expert's transactions, newest first, by date range
+        ]
+    }
+
+class EarningRollup(Document):
+    """
+    Earnings of one expert for one service type in one day, week or month,
+    kept up to date by users.earnings
+    """
+    expert = ReferenceField('MongoUser', reverse_delete_rule=CASCADE, required=True)
+    period = StringField(required=True, choices=['day', 'week', 'month'])
+    period_start = DateTimeField(required=True)  # Midnight of the day, the Monday of the week, or the 1st of the month
+    service_type = StringField(required=True, choices=['repair', 'academic'])
+    total = Decimal128Field(default=decimal.Decimal('0'))
+    paid = Decimal128Field(default=decimal.Decimal('0'))
+    count = IntField(default=0)
+    
+    meta = {
+        'collection': 'earning_rollups',
+        'indexes': [
+            {'fields': ['expert', 'period', 'period_start', 'service_type'], 'unique': True}
+        ]
     }
\ No newline at end of file
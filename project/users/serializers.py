@@ -40,11 +40,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class ExpertProfileSerializer(serializers.Serializer):
     expertise_areas = serializers.CharField()
-    experience_years = serializers.CharField()
-    hourly_rate = serializers.CharField()
+    experience_years = serializers.IntegerField(min_value=0)
+    hourly_rate = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
     availability_hours = serializers.CharField()
-    completed_services = serializers.CharField(read_only=True)
-    rating = serializers.CharField(read_only=True)
+    completed_services = serializers.IntegerField(read_only=True)
+    rating = serializers.FloatField(read_only=True)
 
 class EarningRecordSerializer(serializers.Serializer):
     amount = serializers.CharField()
@@ -0,0 +1,27 @@
+"""
+JWT tokens that carry what most requests need to know about their user.
+
+Besides the user id, the tokens hold the MongoUser id, the user type and
+the user's name, so ClaimsJWTAuthentication can build request.user without
+touching the database. Claims are copied into every access token minted
+from the refresh token, so a name change shows up at the next login.
+"""
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import get_mongo_user_by_id
+
+
+class UserRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user, mongo_user=None):
+        token = super().for_user(user)
+        token['user_type'] = user.user_type
+        token['first_name'] = user.first_name
+        token['last_name'] = user.last_name
+
+        if mongo_user is None:
+            mongo_user = get_mongo_user_by_id(user.id)
+        if mongo_user is not None:
+            token['mongo_user_id'] = str(mongo_user.id)
+        return token
@@ -5,7 +5,9 @@ from .views import (
     UserLoginView,
     UserProfileView,
     ExpertProfileViewSet,
-    EarningsDashboardView
+    EarningsDashboardView,
+    EarningsChartView,
+    LeaderboardView
 )
 
 urlpatterns = [
@@ -15,4 +17,6 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('expert-profile/', ExpertProfileViewSet.as_view({'get': 'retrieve', 'put': 'update'}), name='expert-profile'),
     path('earnings/', EarningsDashboardView.as_view(), name='earnings'),
+    path('earnings/chart/', EarningsChartView.as_view(), name='earnings-chart'),
+    path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
 ]
\ No newline at end of file
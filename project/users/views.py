@@ -1,11 +1,21 @@
+import datetime
+from decimal import Decimal
+
+from bson import Decimal128
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import status, viewsets, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.pagination import PageNumberPagination
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from mongoengine.queryset.visitor import Q
 
+from .cache import get_mongo_user, invalidate_mongo_user
+from .earnings import PERIODS, as_decimal, get_rollups, period_start, range_rollups
+from .leaderboard import SERVICE_TYPES, DEFAULT_LEADERBOARD_SIZE, sync_expert, top_experts
 from .models import User, MongoUser, ExpertProfile, EarningRecord
+from .tokens import UserRefreshToken
 from .serializers import (
     UserRegistrationSerializer, 
     UserLoginSerializer, 
@@ -41,14 +51,14 @@ class UserRegistrationView(APIView):
             if user.user_type in ['teacher', 'technician']:
                 expert_profile = ExpertProfile(
                     user=mongo_user,
+                    user_type=user.user_type,
                     expertise_areas="",
-                    experience_years="0",
-                    hourly_rate="0",
                     availability_hours="9-17",
                 )
                 expert_profile.save()
+                sync_expert(mongo_user.id)
             
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user, mongo_user=mongo_user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -64,7 +74,7 @@ class UserLoginView(APIView):
         serializer = UserLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         
         # Return user profile along with tokens
         profile = UserProfileSerializer(user)
@@ -77,6 +87,9 @@ class UserLoginView(APIView):
 
 
 class UserProfileView(APIView):
+    # Reads and saves the full User model, so it is loaded from the database rather than built from token claims
+    authentication_classes = [JWTAuthentication]
+    
     def get(self, request):
         serializer = UserProfileSerializer(request.user)
         return Response(serializer.data)
@@ -94,6 +107,11 @@ class UserProfileView(APIView):
                 mongo_user.bio = request.user.bio if request.user.bio else ""
                 mongo_user.profile_picture_url = request.user.profile_picture.url if request.user.profile_picture else ""
                 mongo_user.save()
+                invalidate_mongo_user(request.user.id, mongo_user.id)
+                
+                # Leaderboards show the expert's name
+                if mongo_user.user_type in ['teacher', 'technician']:
+                    sync_expert(mongo_user.id)
             
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -104,7 +122,7 @@ class ExpertProfileViewSet(viewsets.ViewSet):
         if request.user.user_type not in ['teacher', 'technician']:
             return Response({"detail": "Not an expert user"}, status=status.HTTP_403_FORBIDDEN)
         
-        mongo_user = MongoUser.objects(user_id=str(request.user.id)).first()
+        mongo_user = get_mongo_user(request)
         if not mongo_user:
             return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         
@@ -143,49 +161,189 @@ class ExpertProfileViewSet(viewsets.ViewSet):
         expert_profile.experience_years = serializer.validated_data.get('experience_years', expert_profile.experience_years)
         expert_profile.hourly_rate = serializer.validated_data.get('hourly_rate', expert_profile.hourly_rate)
         expert_profile.availability_hours = serializer.validated_data.get('availability_hours', expert_profile.availability_hours)
+        expert_profile.user_type = request.user.user_type
         expert_profile.save()
         
         # Also update the expertise_areas in MongoUser for easier querying
         mongo_user.expertise_areas = expert_profile.expertise_areas
         mongo_user.save()
+        invalidate_mongo_user(request.user.id, mongo_user.id)
+        sync_expert(mongo_user.id)
         
         return Response(serializer.data)
 
 
+class LeaderboardView(APIView):
+    """Top experts of a service type, optionally within one expertise area"""
+    
+    def get(self, request):
+        service_type = request.query_params.get('service_type')
+        if service_type not in SERVICE_TYPES.values():
+            return Response({"detail": "service_type must be repair or academic"}, status=status.HTTP_400_BAD_REQUEST)
+        area = request.query_params.get('area', '')
+        
+        try:
+            entries = top_experts(service_type, area, request.query_params.get('limit', DEFAULT_LEADERBOARD_SIZE))
+        except ValueError:
+            return Response({"detail": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'service_type': service_type,
+            'area': area,
+            'results': [
+                {
+                    'rank': rank,
+                    'expert_id': str(entry.expert.id),
+                    'name': entry.name,
+                    'score': round(entry.score, 3),
+                    'rating': entry.rating,
+                    'rating_count': entry.rating_count,
+                    'completed_services': entry.completed_services
+                }
+                for rank, entry in enumerate(entries, start=1)
+            ]
+        })
+
+
 class EarningsDashboardView(APIView):
     def get(self, request):
         if request.user.user_type not in ['teacher', 'technician']:
             return Response({"detail": "Not an expert user"}, status=status.HTTP_403_FORBIDDEN)
         
-        mongo_user = MongoUser.objects(user_id=str(request.user.id)).first()
+        mongo_user = get_mongo_user(request)
         if not mongo_user:
             return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        # Get all earnings for the expert
-        earnings = EarningRecord.objects(expert=mongo_user)
-        serializer = EarningRecordSerializer([
-            {
-                'amount': e.amount,
-                'service_type': e.service_type,
-                'service_id': e.service_id,
-                'date': e.date,
-                'is_paid': e.is_paid
-            } for e in earnings
-        ], many=True)
-        
-        # Calculate total earnings
-        total_earnings = sum(float(e.amount) for e in earnings)
-        paid_earnings = sum(float(e.amount) for e in earnings if e.is_paid)
-        pending_earnings = total_earnings - paid_earnings
+        # Optional date range: ?start=YYYY-MM-DD&end=YYYY-MM-DD (end day included) or full ISO datetimes
+        try:
+            date_range = parse_date_range(request.query_params.get('start'), request.query_params.get('end'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        match = {'expert': mongo_user.id}
+        if date_range:
+            match['date'] = date_range
+        
+        # Totals in one aggregation; amounts are Decimal128, so MongoDB sums them exactly
+        totals = next(EarningRecord.objects.aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': None,
+                'total': {'$sum': '$amount'},
+                'paid': {'$sum': {'$cond': ['$is_paid', '$amount', Decimal128('0')]}}
+            }}
+        ]), None)
+        total_earnings = as_decimal(totals['total']) if totals else Decimal('0')
+        paid_earnings = as_decimal(totals['paid']) if totals else Decimal('0')
+        
+        # One page of transactions, newest first
+        earnings = EarningRecord.objects(__raw__=match).only(
+            'amount', 'service_type', 'service_id', 'date', 'is_paid'
+        ).order_by('-date')
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(earnings, request, view=self)
+        serializer = EarningRecordSerializer(page, many=True)
         
         # Get expert profile for service count
-        expert_profile = ExpertProfile.objects(user=mongo_user).first()
-        completed_services = int(expert_profile.completed_services) if expert_profile else 0
+        expert_profile = ExpertProfile.objects(user=mongo_user).only('completed_services').first()
+        completed_services = expert_profile.completed_services if expert_profile else 0
         
         return Response({
             'total_earnings': str(total_earnings),
             'paid_earnings': str(paid_earnings),
-            'pending_earnings': str(pending_earnings),
+            'pending_earnings': str(total_earnings - paid_earnings),
             'completed_services': str(completed_services),
+            'count': paginator.page.paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'transactions': serializer.data
-        })
\ No newline at end of file
+        })
+
+
+
+class EarningsChartView(APIView):
+    """Earnings per day, week or month, served from the rollups in users.earnings"""
+    
+    # Range shown when no start is given, per period
+    DEFAULT_SPANS = {
+        'day': datetime.timedelta(days=30),
+        'week': datetime.timedelta(weeks=12),
+        'month': datetime.timedelta(days=365)
+    }
+    
+    def get(self, request):
+        if request.user.user_type not in ['teacher', 'technician']:
+            return Response({"detail": "Not an expert user"}, status=status.HTTP_403_FORBIDDEN)
+        
+        mongo_user = get_mongo_user(request)
+        if not mongo_user:
+            return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        period = request.query_params.get('period', 'day')
+        if period not in PERIODS:
+            return Response({"detail": f"period must be one of {', '.join(PERIODS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        service_type = request.query_params.get('service_type') or None
+        
+        # Whole days; end is inclusive
+        try:
+            end = _day(request.query_params['end']) if request.query_params.get('end') else period_start(datetime.datetime.now(), 'day')
+            start = _day(request.query_params['start']) if request.query_params.get('start') else end - self.DEFAULT_SPANS[period]
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({"detail": "start must not be after end"}, status=status.HTTP_400_BAD_REQUEST)
+        end_exclusive = end + datetime.timedelta(days=1)
+        
+        # Chart points, service types combined unless filtered
+        series = {}
+        for rollup in get_rollups(mongo_user.id, period, period_start(start, period), end_exclusive, service_type):
+            point = series.setdefault(rollup.period_start, {'total': Decimal('0'), 'paid': Decimal('0'), 'count': 0})
+            self.add(point, rollup)
+        
+        # Exact totals for the range from month rows plus day rows at the edges
+        totals = {'total': Decimal('0'), 'paid': Decimal('0'), 'count': 0}
+        for rollup in range_rollups(mongo_user.id, start, end_exclusive, service_type):
+            self.add(totals, rollup)
+        
+        return Response({
+            'period': period,
+            'start': start.date(),
+            'end': end.date(),
+            'series': [dict(self.format(point), period_start=key.date()) for key, point in series.items()],
+            'totals': self.format(totals)
+        })
+    
+    def add(self, point, rollup):
+        point['total'] += rollup.total or 0
+        point['paid'] += rollup.paid or 0
+        point['count'] += rollup.count
+    
+    def format(self, point):
+        return {
+            'total': str(point['total']),
+            'paid': str(point['paid']),
+            'pending': str(point['total'] - point['paid']),
+            'count': point['count']
+        }
+
+
+def parse_date_range(start, end):
+    """Return a MongoDB range condition for the given ISO dates or datetimes, or None if neither is set"""
+    condition = {}
+    if start:
+        start_at = parse_datetime(start) or _day(start)
+        condition['$gte'] = start_at
+    if end:
+        end_at = parse_datetime(end)
+        if end_at:
+            condition['$lte'] = end_at
+        else:
+            condition['$lt'] = _day(end) + datetime.timedelta(days=1)
+    return condition or None
+
+
+def _day(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"Invalid date: {value}")
+    return datetime.datetime.combine(day, datetime.time.min)
\ No newline at end of file